@@ -669,10 +669,7 @@ async def admin_stats_router(update: Update, context: ContextTypes.DEFAULT_TYPE)
     elif text == "📊 Overview":
         with get_db() as db:
             total_users = db.query(User).count()
-            active_premium = db.query(User).filter(
-                User.premium_until != None,
-                User.premium_until > datetime.utcnow()
-            ).count()
+            active_premium = db.query(User).filter(User.is_premium).count()
             total_admins = db.query(User).filter(User.is_admin == True).count()
             blocked_users = db.query(User).filter(User.is_blocked == True).count()
             today = date.today()
@@ -704,13 +701,16 @@ async def admin_stats_router(update: Update, context: ContextTypes.DEFAULT_TYPE)
     elif text == "👥 User Stats":
         with get_db() as db:
             today = date.today()
+            # Join users into the aggregate instead of loading each one after
             top_users = db.query(
-                QuotaUsage.user_id,
+                User.first_name,
                 func.sum(QuotaUsage.quick_chat + QuotaUsage.code_chat +
                          QuotaUsage.convert + QuotaUsage.pptx).label('total')
+            ).join(
+                QuotaUsage, QuotaUsage.user_id == User.id
             ).filter(
                 QuotaUsage.usage_date == today
-            ).group_by(QuotaUsage.user_id).order_by(func.sum(
+            ).group_by(User.id, User.first_name).order_by(func.sum(
                 QuotaUsage.quick_chat + QuotaUsage.code_chat +
                 QuotaUsage.convert + QuotaUsage.pptx
             ).desc()).limit(10).all()
@@ -721,12 +721,10 @@ async def admin_stats_router(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 )
             else:
                 lines = []
-                for idx, (user_id, total) in enumerate(top_users, 1):
-                    user = db.query(User).filter(User.id == user_id).first()
-                    if user:
-                        lines.append(
-                            f"{idx}. **{user.first_name}** \\- {int(total)} actions"
-                        )
+                for idx, (first_name, total) in enumerate(top_users, 1):
+                    lines.append(
+                        f"{idx}. **{first_name}** \\- {int(total)} actions"
+                    )
                 msg = "🏆 **Top 10 Users Today:**\n\n" + "\n".join(lines)
                 await update.message.reply_text(msg, parse_mode="Markdown")
         return ADMIN_STATS
@@ -8,6 +8,7 @@ All logs displayed in console + saved to file
 import logging
 import sys
 import asyncio
+from datetime import time
 
 from handlers.file_operations import file_operations_handler
 
@@ -29,7 +30,9 @@ from telegram.ext import (
 )
 
 from config import TELEGRAM_TOKEN
-from db import init_db, check_db_health
+from db import init_db, check_db_health, ensure_action_log_partitions
+from utils.openai_client import close_client, warm_token_encoding
+from utils.quotas import flush_pending_quotas
 from models_enums import Language
 from keyboard import get_main_keyboard
 
@@ -158,6 +161,34 @@ async def error_handler(update, context):
         logger.error(f"Failed to send error message to user: {e}")
 
 
+# ============================================================================
+# STARTUP / SHUTDOWN
+# ============================================================================
+
+async def maintain_action_log_partitions(context) -> None:
+    """Daily job: create upcoming action_logs partitions before they are needed."""
+    await asyncio.to_thread(ensure_action_log_partitions)
+
+
+async def post_init(application) -> None:
+    """Load the token encoding and schedule maintenance jobs before polling starts."""
+    await warm_token_encoding()
+
+    if application.job_queue is None:
+        logger.warning("⚠️ JobQueue unavailable (install APScheduler), partition maintenance runs at startup only")
+        return
+
+    application.job_queue.run_daily(
+        maintain_action_log_partitions, time(hour=3), name="action_log_partitions"
+    )
+
+
+async def post_shutdown(application) -> None:
+    """Flush buffered quota increments and release HTTP pools when the bot stops."""
+    await flush_pending_quotas()
+    await close_client()
+
+
 # ============================================================================
 # MAIN APPLICATION
 # ============================================================================
@@ -207,6 +238,8 @@ def main() -> None:
             .connect_timeout(30.0)
             .read_timeout(30.0)
             .write_timeout(30.0)
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
             .build()
         )
         logger.info("Application built successfully")
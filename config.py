@@ -29,6 +29,12 @@ IMAGE_MODEL = "gpt-image-1"
 PREMIUM_MAX_TOKENS = 2000
 FREE_MAX_TOKENS = 800
 
+# Account rate limits, used to throttle requests locally instead of
+# running into 429 responses (set to match your OpenAI usage tier)
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+OPENAI_IMAGES_PER_MINUTE = int(os.getenv("OPENAI_IMAGES_PER_MINUTE", "50"))
+
 # ============================================================================
 # ADMIN CONFIGURATION
 # ============================================================================
@@ -8,11 +8,17 @@ FIXED FOR:
 - SQLAlchemy 2.0 text() requirements
 """
 
+import enum
+import io
+import json
 import logging
+import re
 from contextlib import contextmanager
+from datetime import date, datetime
 from typing import Optional
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker, Session
 
 from config import DATABASE_URL
@@ -25,17 +31,21 @@ logger = logging.getLogger(__name__)
 # ENGINE CONFIGURATION (OPTIMIZED)
 # ============================================================================
 
+_is_sqlite = DATABASE_URL.startswith("sqlite")
+
 # Create engine with appropriate settings
 engine = create_engine(
     DATABASE_URL,
     connect_args={
         "check_same_thread": False,
         "timeout": 20  # Increase timeout to 20 seconds
-    } if DATABASE_URL.startswith("sqlite") else {},
+    } if _is_sqlite else {},
     future=True,
     echo=False,  # Set to True for SQL debugging
     pool_pre_ping=True,  # Verify connections before using
-    pool_recycle=3600,  # Recycle connections after 1 hour
+    pool_recycle=1800,  # Recycle before pgbouncer/firewall idle cutoffs
+    # SQLite pools don't take sizing arguments
+    **({} if _is_sqlite else {"pool_size": 10, "max_overflow": 20}),
 )
 
 # Create session factory
@@ -65,6 +75,8 @@ def init_db() -> None:
     Base.metadata.create_all(bind=engine)
     logger.info("Database tables created")
 
+    ensure_action_log_partitions()
+
     # Create default plans
     with get_db() as db:
         # Free plan
@@ -182,6 +194,98 @@ def log_action(
         return None
 
 
+# ============================================================================
+# BULK LOADING
+# ============================================================================
+
+# Below this many rows a multi-row INSERT is cheaper than setting up COPY
+BULK_COPY_THRESHOLD = 100
+
+
+def _copy_value(value) -> str:
+    """Encode a Python value as a PostgreSQL COPY text-format field."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, enum.Enum):
+        value = value.name
+    elif isinstance(value, bool):
+        value = "t" if value else "f"
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    elif isinstance(value, (datetime, date)):
+        value = value.isoformat()
+
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def bulk_copy(db: Session, model, rows: list[dict]) -> int:
+    """
+    Bulk-insert rows for backfills and restores.
+
+    On PostgreSQL (psycopg2) large batches are streamed with COPY FROM
+    STDIN; smaller batches and other databases use a multi-row INSERT.
+    All rows must provide the same keys. Python-side column defaults are
+    applied to omitted columns, server defaults are left to the database.
+
+    Args:
+        db: Database session
+        model: Mapped model class (e.g. ActionLog, StorageFile)
+        rows: Column-name to value dictionaries
+
+    Returns:
+        Number of rows inserted
+    """
+    if not rows:
+        return 0
+
+    conn = db.connection()
+    use_copy = (
+        len(rows) >= BULK_COPY_THRESHOLD
+        and conn.dialect.name == "postgresql"
+        and conn.dialect.driver == "psycopg2"
+    )
+
+    if not use_copy:
+        db.execute(insert(model), rows)
+        return len(rows)
+
+    table = model.__table__
+    row_columns = list(rows[0])
+    defaults = [
+        c for c in table.columns
+        if c.name not in row_columns and c.default is not None
+        and (c.default.is_scalar or c.default.is_callable)
+    ]
+
+    buffer = io.StringIO()
+    for row in rows:
+        values = [row[name] for name in row_columns]
+        values += [
+            c.default.arg if c.default.is_scalar else c.default.arg(None)
+            for c in defaults
+        ]
+        buffer.write("\t".join(_copy_value(v) for v in values))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    column_list = ", ".join(
+        f'"{name}"' for name in row_columns + [c.name for c in defaults]
+    )
+    with conn.connection.dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY "{table.name}" ({column_list}) FROM STDIN', buffer
+        )
+
+    logger.info(f"Copied {len(rows)} rows into {table.name}")
+    return len(rows)
+
+
 # ============================================================================
 # CLEANUP UTILITIES
 # ============================================================================
@@ -232,6 +336,146 @@ def cleanup_old_quotas(days: int = 90) -> int:
         return deleted
 
 
+def cleanup_old_action_logs(months: int = 12) -> int:
+    """
+    Remove action logs older than the specified number of months.
+
+    On PostgreSQL whole monthly partitions are dropped; other databases
+    fall back to a DELETE.
+
+    Args:
+        months: Number of full months of logs to keep
+
+    Returns:
+        Number of partitions dropped (PostgreSQL) or rows deleted
+    """
+    cutoff = _add_months(date.today().replace(day=1), -months)
+
+    with get_db() as db:
+        if engine.dialect.name != "postgresql":
+            deleted = db.query(ActionLog).filter(
+                ActionLog.created_at < cutoff
+            ).delete()
+            logger.info(f"Cleaned up {deleted} old action logs")
+            return deleted
+
+        children = db.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :parent"
+        ), {"parent": ActionLog.__tablename__}).scalars().all()
+
+        dropped = 0
+        for name in children:
+            match = _PARTITION_NAME_RE.fullmatch(name)
+            if not match:
+                continue
+            if date(int(match.group(1)), int(match.group(2)), 1) < cutoff:
+                db.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+                dropped += 1
+
+        logger.info(f"Dropped {dropped} old action log partitions")
+        return dropped
+
+
+# ============================================================================
+# ACTION LOG PARTITIONING (POSTGRESQL)
+# ============================================================================
+
+_PARTITION_NAME_RE = re.compile(r"action_logs_y(\d{4})m(\d{2})")
+
+
+def _add_months(month_start: date, months: int) -> date:
+    """Shift the first day of a month by a number of months."""
+    index = month_start.year * 12 + month_start.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def ensure_action_log_partitions(months_ahead: int = 3) -> int:
+    """
+    Pre-create monthly action_logs partitions on PostgreSQL.
+
+    Creates partitions for the current month and the next months_ahead
+    months, plus a DEFAULT partition that catches rows if this job has
+    not run in time. A missing month is built as a plain table, filled
+    with its rows from the DEFAULT partition and then attached, so late
+    creation never violates the DEFAULT partition's constraint.
+
+    Safe to call repeatedly (at startup and from the daily bot job); a
+    no-op on other databases and on tables that are not partitioned yet.
+
+    Args:
+        months_ahead: Number of future months to pre-create
+
+    Returns:
+        Number of monthly partitions created
+    """
+    if engine.dialect.name != "postgresql":
+        return 0
+
+    parent = ActionLog.__tablename__
+    default = f"{parent}_default"
+    start = date.today().replace(day=1)
+    created = 0
+
+    try:
+        with get_db() as db:
+            relkind = db.execute(
+                text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"),
+                {"name": parent}
+            ).scalar()
+            if relkind != "p":
+                # Tables created before partitioning need a manual conversion
+                logger.warning(
+                    f"⚠️ {parent} is not a partitioned table, skipping partition maintenance"
+                )
+                return 0
+
+            db.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{default}" PARTITION OF "{parent}" DEFAULT'
+            ))
+
+            for offset in range(months_ahead + 1):
+                lower = _add_months(start, offset)
+                upper = _add_months(lower, 1)
+                name = f"{parent}_y{lower.year}m{lower.month:02d}"
+
+                exists = db.execute(
+                    text("SELECT to_regclass(:name)"), {"name": name}
+                ).scalar()
+                if exists is not None:
+                    continue
+
+                bounds = {"lower": lower, "upper": upper}
+                db.execute(text(
+                    f'CREATE TABLE "{name}" '
+                    f'(LIKE "{parent}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+                ))
+                moved = db.execute(text(
+                    f'WITH moved AS ('
+                    f'DELETE FROM "{default}" '
+                    f'WHERE created_at >= :lower AND created_at < :upper '
+                    f'RETURNING *) '
+                    f'INSERT INTO "{name}" SELECT * FROM moved'
+                ), bounds).rowcount
+                db.execute(text(
+                    f'ALTER TABLE "{parent}" ATTACH PARTITION "{name}" '
+                    f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+                ))
+                created += 1
+
+                if moved:
+                    logger.info(f"Moved {moved} action logs from {default} into {name}")
+
+    except SQLAlchemyError as e:
+        logger.error(f"❌ Action log partition maintenance failed: {e}")
+        return 0
+
+    logger.info(f"Created {created} monthly action log partitions")
+    return created
+
+
 # ============================================================================
 # DATABASE HEALTH CHECK (FIXED FOR SQLALCHEMY 2.0)
 # ============================================================================
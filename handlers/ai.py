@@ -36,7 +36,7 @@ from utils.quotas import (
 )
 from utils.openai_client import chat_with_ai, generate_image
 from utils.pptx_creator import create_pptx
-from utils.storage_logger import save_and_log_image, save_and_log_file
+from utils.storage_logger import save_and_log_image, save_and_log_file, download_image
 from handlers.state import AI_MENU, CHAT
 
 logger = logging.getLogger(__name__)
@@ -280,8 +280,6 @@ async def _handle_image_generation(
         user_input: str
 ) -> int:
     """Handle image generation with comprehensive storage."""
-    import requests
-
     # Check trial reset
     if maybe_reset_trial(db, user):
         await message.reply_text(
@@ -365,15 +363,16 @@ async def _handle_image_generation(
 
         # 📦 STORE TO DATABASE
         try:
-            img_bytes = requests.get(img_url).content
+            img_buffer = await download_image(img_url)
             await save_and_log_image(
                 context=context,
                 db=db,
                 user=user,
-                image_data=img_bytes,
+                image_data=img_buffer.getvalue(),
                 prompt=user_input,
                 category=FileCategory.image_gen,
-                model=IMAGE_MODEL
+                model=IMAGE_MODEL,
+                sha256=img_buffer.hexdigest()
             )
         except Exception as e:
             logger.error(f"❌ Failed to store generated image: {e}")
@@ -640,7 +639,7 @@ async def _handle_pptx_creation(
 
             await context.bot.send_chat_action(chat_id=message.chat_id, action=ChatAction.UPLOAD_DOCUMENT)
 
-            file_path = create_pptx(title, raw_slides, theme_name=theme)
+            file_path = await create_pptx(title, raw_slides, theme_name=theme)
 
             if not file_path:
                 await progress_msg.delete()
@@ -26,7 +26,7 @@ from utils.network_retry import (
     safe_send_photo,
     safe_delete_message
 )
-from utils.storage_logger import save_both_images
+from utils.storage_logger import save_both_images, download_image
 from handlers.state import AI_MENU, IMAGE_EDIT
 
 logger = logging.getLogger(__name__)
@@ -416,8 +416,8 @@ Iltimos, kuting..."""
                 # ============================================================
                 # DOWNLOAD EDITED IMAGE
                 # ============================================================
-                import requests
-                edited_bytes = requests.get(edited_url, timeout=30).content
+                edited_buffer = await download_image(edited_url, timeout=30)
+                edited_bytes = edited_buffer.getvalue()
                 logger.info(f"✅ Edited image downloaded: {len(edited_bytes)} bytes")
 
                 await safe_delete_message(status_msg)
@@ -481,7 +481,8 @@ Iltimos, kuting..."""
                         original_bytes=bytes(original_bytes),
                         edited_bytes=edited_bytes,
                         prompt=edit_prompt,
-                        model=IMAGE_MODEL
+                        model=IMAGE_MODEL,
+                        edited_sha256=edited_buffer.hexdigest()
                     )
                     logger.info("✅ Stored both images to channel")
                 except Exception as e:
@@ -5,15 +5,21 @@ This module defines all database tables and their relationships,
 including users, plans, quotas, trials, files, and action logs.
 """
 
-from datetime import datetime, date
+import time
+from datetime import datetime, date, timedelta
 from typing import Optional
 
 from sqlalchemy import (
     Column, Integer, String, Boolean, DateTime, Date, BigInteger,
     ForeignKey, Enum, Text, CheckConstraint, UniqueConstraint,
-    Index, JSON
+    PrimaryKeyConstraint, Index, JSON, Table, cast, event, text, update
 )
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
 from sqlalchemy.sql import func
 
 from models_enums import (
@@ -23,6 +29,64 @@ from models_enums import (
 
 Base = declarative_base()
 
+# Cached local date for the per-message quota path. Refreshed lazily once
+# the next local midnight has passed, so the hot path costs one time.time().
+_today: date = date.today()
+_today_expires: float = 0.0
+
+
+def current_date() -> date:
+    """Return today's local date, recomputed only after midnight."""
+    global _today, _today_expires
+
+    if time.time() >= _today_expires:
+        _today = date.today()
+        tomorrow = datetime.combine(_today + timedelta(days=1), datetime.min.time())
+        _today_expires = tomorrow.timestamp()
+
+    return _today
+
+
+@event.listens_for(Table, "after_create")
+def _apply_fillfactor(table, connection, **kw):
+    """
+    Apply info["fillfactor"] to hot-updated tables on PostgreSQL.
+
+    Leaving free space in each page keeps counter updates HOT (no index
+    rewrite). SQLAlchemy has no Table-level storage option for this.
+    """
+    fillfactor = table.info.get("fillfactor")
+    if fillfactor and connection.dialect.name == "postgresql":
+        connection.execute(text(
+            f'ALTER TABLE "{table.name}" SET (fillfactor = {int(fillfactor)})'
+        ))
+
+
+def _conflict_insert(session):
+    """Return the dialect insert() that supports ON CONFLICT, or None."""
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    return None
+
+
+def _varchar_enum(enum_cls) -> Enum:
+    """
+    Enum column type stored as VARCHAR(32) with a CHECK constraint.
+
+    Avoids native database enum types, which cannot drop values and need
+    ALTER TYPE for every new member.
+    """
+    return Enum(
+        enum_cls,
+        native_enum=False,
+        length=32,
+        create_constraint=True,
+        validate_strings=True,
+    )
+
 
 # ============================================================================
 # PLAN MODEL
@@ -33,7 +97,7 @@ class Plan(Base):
 
     __tablename__ = "plans"
 
-    code = Column(Enum(PlanCode), primary_key=True)
+    code = Column(_varchar_enum(PlanCode), primary_key=True)
     title = Column(String(64), nullable=False, default="")
     description = Column(String(255), nullable=False, default="")
 
@@ -62,6 +126,14 @@ class User(Base):
     __tablename__ = "users"
     __table_args__ = (
         CheckConstraint('tg_id > 0', name='check_tg_id_positive'),
+        # Partial index: only premium (non-NULL) rows are indexed
+        Index(
+            'ix_users_premium_active', 'premium_until',
+            postgresql_where=text('premium_until IS NOT NULL'),
+            sqlite_where=text('premium_until IS NOT NULL'),
+        ),
+        # updated_at is touched on every interaction
+        {'info': {'fillfactor': 70}},
     )
 
     id = Column(Integer, primary_key=True)
@@ -70,11 +142,11 @@ class User(Base):
     first_name = Column(String(64))
     last_name = Column(String(64))
     phone = Column(String(32))
-    lang = Column(Enum(Language), nullable=True)
+    lang = Column(_varchar_enum(Language), nullable=True)
 
     # Plan and premium
     plan_code = Column(
-        Enum(PlanCode),
+        _varchar_enum(PlanCode),
         ForeignKey("plans.code", onupdate="CASCADE"),
         nullable=False,
         default=PlanCode.free
@@ -100,7 +172,8 @@ class User(Base):
     )
 
     # Relationships
-    plan = relationship("Plan", back_populates="users")
+    # Plan limits are read on every quota check; fetch them with the user
+    plan = relationship("Plan", back_populates="users", lazy="joined")
     quotas = relationship("QuotaUsage", back_populates="user", cascade="all, delete-orphan")
     chat_sessions = relationship("ChatSession", back_populates="user", cascade="all, delete-orphan")
     storage_files = relationship("StorageFile", back_populates="owner", cascade="all, delete-orphan")
@@ -113,18 +186,35 @@ class User(Base):
     )
     trial = relationship("TrialUsage", back_populates="user", uselist=False, cascade="all, delete-orphan")
 
-    @property
+    @hybrid_property
     def is_premium(self) -> bool:
         """Check if user currently has active premium."""
         return bool(self.premium_until and datetime.utcnow() < self.premium_until)
 
-    @property
+    @is_premium.expression
+    def is_premium(cls):
+        """SQL form of is_premium, usable in filters."""
+        return cls.premium_until > func.now()
+
+    @hybrid_property
     def full_name(self) -> str:
         """Get user's full display name."""
         parts = [self.first_name, self.last_name]
         name = " ".join(p for p in parts if p)
         return name or self.username or f"User{self.tg_id}"
 
+    @full_name.expression
+    def full_name(cls):
+        """SQL form of full_name with the same fallbacks."""
+        name = func.trim(
+            func.coalesce(cls.first_name, "") + " " + func.coalesce(cls.last_name, "")
+        )
+        return func.coalesce(
+            func.nullif(name, ""),
+            cls.username,
+            "User" + cast(cls.tg_id, String)
+        )
+
     def get_daily_limit(self, quota_type: str) -> int:
         """Get daily limit for a quota type (respects custom overrides)."""
         override = getattr(self, f"daily_{quota_type}", None)
@@ -169,7 +259,9 @@ class QuotaUsage(Base):
     __tablename__ = "quota_usage"
     __table_args__ = (
         UniqueConstraint("user_id", "usage_date", name="uq_quota_user_day"),
-        Index('ix_quota_day', 'usage_date')
+        Index('ix_quota_day', 'usage_date'),
+        # Counters are incremented many times per day
+        {'info': {'fillfactor': 70}},
     )
 
     id = Column(Integer, primary_key=True)
@@ -184,23 +276,87 @@ class QuotaUsage(Base):
 
     user = relationship("User", back_populates="quotas")
 
+    COUNTER_FIELDS = frozenset(("quick_chat", "code_chat", "convert", "pptx"))
+
     @classmethod
     def get_or_create(cls, session, user_id: int, usage_date: Optional[date] = None):
-        """Get existing quota record or create new one for the date."""
+        """
+        Get existing quota record or create new one for the date.
+
+        Lookups hit the uq_quota_user_day index. A missing row is created
+        with INSERT ... ON CONFLICT DO NOTHING RETURNING, so two handlers
+        racing on the first message of the day cannot collide.
+        """
         if usage_date is None:
-            usage_date = date.today()
+            usage_date = current_date()
 
-        quota = session.query(cls).filter_by(
-            user_id=user_id,
-            usage_date=usage_date
-        ).first()
+        query = session.query(cls).filter_by(user_id=user_id, usage_date=usage_date)
+        quota = query.first()
+        if quota:
+            return quota
 
-        if not quota:
+        insert = _conflict_insert(session)
+        if insert is None:
             quota = cls(user_id=user_id, usage_date=usage_date)
             session.add(quota)
             session.flush()
+            return quota
+
+        stmt = (
+            insert(cls)
+            .values(user_id=user_id, usage_date=usage_date)
+            .on_conflict_do_nothing(index_elements=[cls.user_id, cls.usage_date])
+            .returning(cls)
+        )
+        # No row back means a concurrent request inserted it first
+        return session.scalars(stmt).first() or query.first()
+
+    @classmethod
+    def increment(
+            cls,
+            session,
+            user_id: int,
+            field: str,
+            amount: int = 1,
+            usage_date: Optional[date] = None
+    ) -> int:
+        """
+        Atomically add amount to a daily counter and return the new value.
+
+        On PostgreSQL and SQLite this is a single
+        INSERT ... ON CONFLICT DO UPDATE ... RETURNING, so the first use of
+        the day and later bumps are one round trip with no lost updates.
+        """
+        if field not in cls.COUNTER_FIELDS:
+            raise ValueError(f"Unknown quota field: {field}")
+        if usage_date is None:
+            usage_date = current_date()
+
+        column = getattr(cls, field)
+        insert = _conflict_insert(session)
+
+        if insert is None:
+            quota = cls.get_or_create(session, user_id, usage_date)
+            session.execute(
+                update(cls).where(cls.id == quota.id).values({field: column + amount})
+            )
+            session.refresh(quota, [field])
+            return getattr(quota, field)
+
+        stmt = insert(cls).values(user_id=user_id, usage_date=usage_date, **{field: amount})
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.user_id, cls.usage_date],
+            set_={field: column + stmt.excluded[field]},
+        ).returning(cls.id, column)
 
-        return quota
+        quota_id, value = session.execute(stmt).one()
+
+        # Keep an already-loaded row in this session in step with the database
+        quota = session.identity_map.get(identity_key(cls, quota_id))
+        if quota is not None:
+            set_committed_value(quota, field, value)
+
+        return value
 
 
 # ============================================================================
@@ -226,7 +382,7 @@ class StorageFile(Base):
     created_at = Column(String, default=lambda: datetime.utcnow().isoformat())
 
     # Relationships
-    owner = relationship("User", back_populates="storage_files", lazy="joined")
+    owner = relationship("User", back_populates="storage_files")
 
     def __repr__(self):
         return f"<StorageFile id={self.id} category={self.category} owner={self.owner_id}>"
@@ -247,8 +403,8 @@ class FileJob(Base):
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
-    kind = Column(Enum(FileJobKind), nullable=False, default=FileJobKind.unknown)
-    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.pending, index=True)
+    kind = Column(_varchar_enum(FileJobKind), nullable=False, default=FileJobKind.unknown)
+    status = Column(_varchar_enum(JobStatus), nullable=False, default=JobStatus.pending, index=True)
     input_file_id = Column(Integer, ForeignKey("storage_files.id", ondelete="SET NULL"))
     output_file_id = Column(Integer, ForeignKey("storage_files.id", ondelete="SET NULL"))
     params = Column(JSON, nullable=False, default=dict, server_default='{}')
@@ -284,7 +440,7 @@ class ChatSession(Base):
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    mode = Column(Enum(ChatMode), nullable=False)
+    mode = Column(_varchar_enum(ChatMode), nullable=False)
     title = Column(String(128))
     provider_thread_id = Column(String(128))
     token_spent = Column(Integer, nullable=False, default=0)
@@ -322,19 +478,46 @@ class PremiumGrant(Base):
 # ACTION LOG MODEL
 # ============================================================================
 
+@compiles(PrimaryKeyConstraint, "postgresql")
+def _compile_partitioned_pk(constraint, compiler, **kw):
+    """
+    Include the partition key in the primary key of partitioned tables.
+
+    PostgreSQL requires every unique constraint on a partitioned table to
+    contain the partitioning column, so the DDL key becomes (id, created_at)
+    there while the ORM and other dialects keep the plain integer key.
+    """
+    partition_key = constraint.table.info.get("partition_key")
+    if partition_key and partition_key not in constraint.columns:
+        names = [c.name for c in constraint.columns] + [partition_key]
+        return "PRIMARY KEY (%s)" % ", ".join(
+            compiler.preparer.quote(name) for name in names
+        )
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+
+
 class ActionLog(Base):
-    """Audit log of user actions."""
+    """
+    Audit log of user actions.
+
+    On PostgreSQL the table is range-partitioned by month on created_at;
+    see db.ensure_action_log_partitions() for partition maintenance.
+    """
 
     __tablename__ = "action_logs"
     __table_args__ = (
         Index('ix_actions_user_action', 'user_id', 'action'),
         Index('ix_actions_created', 'created_at'),
         Index('ix_actions_action_created', 'action', 'created_at'),
+        {
+            'postgresql_partition_by': 'RANGE (created_at)',
+            'info': {'partition_key': 'created_at'},
+        },
     )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
-    action = Column(Enum(UserAction), nullable=False, index=True)
+    action = Column(_varchar_enum(UserAction), nullable=False, index=True)
     ref_id = Column(Integer)
     meta = Column(JSON, nullable=False, default=dict, server_default='{}')
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
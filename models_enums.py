@@ -21,9 +21,8 @@ class Language(str, Enum):
     uz = "uz"  # Uzbek
 
 
-from enum import Enum
-
 class FileCategory(str, Enum):
+    """Categories of files kept in the storage channel."""
     image_gen = "image_gen"
     image_edit = "image_edit"
     pptx = "pptx"
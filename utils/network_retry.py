@@ -5,58 +5,85 @@ Implements exponential backoff for transient network errors.
 
 import asyncio
 import logging
-from functools import wraps
-from typing import Callable, Any
+import random
+from functools import lru_cache, wraps
+from typing import Any, Callable, Optional
 
 from telegram.error import NetworkError, TimedOut, RetryAfter
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=None)
+def _backoff_delays(max_retries: int, base_delay: float) -> tuple[float, ...]:
+    """Exponential backoff schedule: base_delay * 2**attempt per attempt."""
+    return tuple(base_delay * (1 << attempt) for attempt in range(max_retries))
+
+
+async def _retry_call(
+        func: Callable,
+        args: tuple = (),
+        kwargs: Optional[dict] = None,
+        max_retries: int = 3,
+        base_delay: float = 2.0
+) -> Any:
+    """
+    Await func(*args, **kwargs), retrying transient network errors.
+
+    Shared by retry_on_network_error and the safe_* helpers so a send
+    does not build and decorate a fresh closure on every call.
+    """
+    kwargs = kwargs or {}
+    delays = _backoff_delays(max_retries, base_delay)
+    last_exception = None
+
+    for attempt in range(max_retries):
+        try:
+            return await func(*args, **kwargs)
+
+        except RetryAfter as e:
+            # Telegram rate limit - wait as instructed
+            wait_time = e.retry_after + 1
+            logger.warning(
+                f"Rate limited by Telegram. "
+                f"Waiting {wait_time}s before retry..."
+            )
+            await asyncio.sleep(wait_time)
+            last_exception = e
+
+        except (NetworkError, TimedOut, OSError) as e:
+            last_exception = e
+
+            if attempt < max_retries - 1:
+                # Exponential backoff (2s, 4s, 8s...) plus up to 10% jitter
+                # so clients don't retry in lockstep after an outage
+                delay = delays[attempt]
+                delay += random.uniform(0, delay * 0.1)
+                logger.warning(
+                    f"Network error on attempt {attempt + 1}/{max_retries}: {e}. "
+                    f"Retrying in {delay:.1f}s..."
+                )
+                await asyncio.sleep(delay)
+            else:
+                logger.error(
+                    f"Network error after {max_retries} attempts: {e}",
+                    exc_info=True
+                )
+
+        except Exception as e:
+            # Non-network error - don't retry
+            logger.error(f"Non-retryable error in {func.__name__}: {e}")
+            raise
+
+    # All retries exhausted
+    raise last_exception
+
+
 def retry_on_network_error(max_retries: int = 3, base_delay: float = 2.0):
     def decorator(func: Callable) -> Callable:
         @wraps(func)
         async def wrapper(*args, **kwargs) -> Any:
-            last_exception = None
-
-            for attempt in range(max_retries):
-                try:
-                    return await func(*args, **kwargs)
-
-                except RetryAfter as e:
-                    # Telegram rate limit - wait as instructed
-                    wait_time = e.retry_after + 1
-                    logger.warning(
-                        f"Rate limited by Telegram. "
-                        f"Waiting {wait_time}s before retry..."
-                    )
-                    await asyncio.sleep(wait_time)
-                    last_exception = e
-
-                except (NetworkError, TimedOut, OSError) as e:
-                    last_exception = e
-
-                    if attempt < max_retries - 1:
-                        # Exponential backoff: 2s, 4s, 8s...
-                        delay = base_delay * (2 ** attempt)
-                        logger.warning(
-                            f"Network error on attempt {attempt + 1}/{max_retries}: {e}. "
-                            f"Retrying in {delay}s..."
-                        )
-                        await asyncio.sleep(delay)
-                    else:
-                        logger.error(
-                            f"Network error after {max_retries} attempts: {e}",
-                            exc_info=True
-                        )
-
-                except Exception as e:
-                    # Non-network error - don't retry
-                    logger.error(f"Non-retryable error in {func.__name__}: {e}")
-                    raise
-
-            # All retries exhausted
-            raise last_exception
+            return await _retry_call(func, args, kwargs, max_retries, base_delay)
 
         return wrapper
 
@@ -69,13 +96,10 @@ async def safe_send_message(
         max_retries: int = 3,
         **kwargs
 ) -> Any:
-
-    @retry_on_network_error(max_retries=max_retries)
-    async def _send():
-        return await message_obj.reply_text(text, **kwargs)
-
     try:
-        return await _send()
+        return await _retry_call(
+            message_obj.reply_text, (text,), kwargs, max_retries
+        )
     except Exception as e:
         logger.error(f"Failed to send message after retries: {e}")
         return None
@@ -87,27 +111,19 @@ async def safe_send_photo(
         max_retries: int = 3,
         **kwargs
 ) -> Any:
-
-
-    @retry_on_network_error(max_retries=max_retries)
-    async def _send():
-        return await message_obj.reply_photo(photo, **kwargs)
-
     try:
-        return await _send()
+        return await _retry_call(
+            message_obj.reply_photo, (photo,), kwargs, max_retries
+        )
     except Exception as e:
         logger.error(f"Failed to send photo after retries: {e}")
         return None
 
 
 async def safe_delete_message(message_obj, max_retries: int = 2) -> bool:
-    @retry_on_network_error(max_retries=max_retries)
-    async def _delete():
-        return await message_obj.delete()
-
     try:
-        await _delete()
+        await _retry_call(message_obj.delete, max_retries=max_retries)
         return True
     except Exception as e:
         logger.debug(f"Could not delete message: {e}")
-        return False
\ No newline at end of file
+        return False
@@ -9,8 +9,14 @@ COMPLETELY REWRITTEN:
 - Comprehensive error handling
 """
 
+import asyncio
 import logging
 import base64
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from functools import lru_cache
 from typing import List, Dict, Optional, Union
 from io import BytesIO
 
@@ -21,7 +27,33 @@ try:
 except ImportError:
     AsyncOpenAI = None
 
-from config import OPENAI_API_KEY, IMAGE_MODEL
+try:
+    # Needs openai>=1.90 installed with the aiohttp extra (openai[aiohttp])
+    from openai import DefaultAioHttpClient
+except ImportError:
+    DefaultAioHttpClient = None
+
+try:
+    # Enables HTTP/2 in httpx (pip install h2)
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+from config import (
+    OPENAI_API_KEY, IMAGE_MODEL,
+    OPENAI_RPM, OPENAI_TPM, OPENAI_IMAGES_PER_MINUTE,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +64,45 @@ _client: Optional[AsyncOpenAI] = None
 # CLIENT INITIALIZATION
 # ============================================================================
 
+# Connection pool shared by every OpenAI call; keep-alive connections
+# are reused so requests skip the TCP + TLS handshake
+MAX_CONNECTIONS = 200
+MAX_KEEPALIVE_CONNECTIONS = 50
+HTTP_TIMEOUT = httpx.Timeout(180.0, connect=10.0)
+
+# Per-request deadlines (seconds), so a stuck call cannot pin a handler
+CHAT_TIMEOUT = 60.0
+VISION_TIMEOUT = 120.0
+IMAGE_TIMEOUT = 180.0
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    """
+    Create the HTTP client used by the OpenAI SDK.
+
+    Prefers the SDK's aiohttp transport, which holds up better than the
+    default httpx transport under many concurrent requests; falls back to
+    httpx (over HTTP/2 when h2 is installed) without the aiohttp extra.
+    """
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+    )
+
+    if DefaultAioHttpClient is not None:
+        try:
+            # max_connections becomes the aiohttp TCPConnector limit
+            client = DefaultAioHttpClient(timeout=HTTP_TIMEOUT, limits=limits)
+            logger.info("🌐 Using aiohttp transport for OpenAI")
+            return client
+        except RuntimeError:
+            # Raised when openai is installed without the aiohttp extra
+            pass
+
+    # HTTP/2 multiplexes concurrent requests over a few connections
+    return httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=limits, http2=HTTP2_AVAILABLE)
+
+
 async def _get_client() -> Optional[AsyncOpenAI]:
     """Initialize and return OpenAI client with retry configuration."""
     global _client
@@ -40,11 +111,14 @@ async def _get_client() -> Optional[AsyncOpenAI]:
         logger.error("❌ OpenAI not available or API key missing")
         return None
 
+    # No await between the check and the assignment, so concurrent
+    # coroutines on the event loop cannot construct two clients
     if _client is None:
-        http_client = httpx.AsyncClient(timeout=120.0)  # Increased timeout
+        http_client = _build_http_client()
         _client = AsyncOpenAI(
             api_key=OPENAI_API_KEY,
             http_client=http_client,
+            timeout=HTTP_TIMEOUT,
             max_retries=3
         )
         logger.info("✅ OpenAI client initialized successfully")
@@ -52,10 +126,115 @@ async def _get_client() -> Optional[AsyncOpenAI]:
     return _client
 
 
+async def close_client() -> None:
+    """Close the shared OpenAI client and its connection pool."""
+    global _client
+
+    if _client is not None:
+        await _client.close()
+        _client = None
+        logger.info("🔌 OpenAI client closed")
+
+
+# ============================================================================
+# RATE LIMITING
+# ============================================================================
+
+class _RateLimiter:
+    """
+    Client-side request and token buckets matching OpenAI rate limits.
+
+    Both buckets refill continuously at limit/60 per second. Callers wait
+    here until capacity is available rather than getting a 429 and
+    retrying blindly.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: Optional[int] = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+
+        self._requests = min(
+            self.requests_per_minute,
+            self._requests + elapsed * self.requests_per_minute / 60
+        )
+        if self.tokens_per_minute:
+            self._tokens = min(
+                self.tokens_per_minute,
+                self._tokens + elapsed * self.tokens_per_minute / 60
+            )
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """Wait until one request and the given number of tokens are free."""
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        else:
+            tokens = 0
+
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+
+                wait = (1 - self._requests) * 60 / self.requests_per_minute
+                if tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+                await asyncio.sleep(max(wait, 0.01))
+
+    def settle(self, estimated: int, actual: int) -> None:
+        """Return over-estimated tokens once actual usage is known."""
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + estimated - actual)
+
+
+_chat_limiter = _RateLimiter(OPENAI_RPM, OPENAI_TPM)
+_image_limiter = _RateLimiter(OPENAI_IMAGES_PER_MINUTE)
+
+# Rough input cost of one high-detail image (at most 6 tiles at 2048 px)
+IMAGE_INPUT_TOKENS = 1105
+
+
+def _estimate_request_tokens(messages: List[Dict], max_tokens: int) -> int:
+    """Estimate prompt plus completion tokens for a chat request."""
+    return max_tokens + sum(
+        _content_tokens(m.get("content", ""), IMAGE_INPUT_TOKENS) for m in messages
+    )
+
+
 # ============================================================================
 # CHAT COMPLETION (Supports Text + Images)
 # ============================================================================
 
+# In-flight text-only chat completions keyed by request content; identical
+# concurrent requests (double taps, common one-line prompts) share one call
+_inflight_chats: Dict[str, "asyncio.Future[str]"] = {}
+
+
+def _chat_key(
+        messages: List[Dict],
+        model: str,
+        temperature: float,
+        max_tokens: int
+) -> Optional[str]:
+    """Fingerprint a text-only chat request; None for multimodal requests."""
+    if any(not isinstance(m.get("content"), str) for m in messages):
+        return None
+
+    payload = json.dumps([model, temperature, max_tokens, messages], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
 async def chat_with_ai(
         messages: List[Dict],
         model: str = "gpt-4o-mini",
@@ -65,6 +244,9 @@ async def chat_with_ai(
     """
     Send chat completion request with support for text and images.
 
+    Identical text-only requests that arrive while one is already in
+    flight wait for that response instead of making their own call.
+
     Args:
         messages: List of message dicts (can include image_url content)
         model: Model to use
@@ -74,28 +256,63 @@ async def chat_with_ai(
     Returns:
         AI response text
     """
+    key = _chat_key(messages, model, temperature, max_tokens)
+    if key is None:
+        return await _chat_completion(messages, model, temperature, max_tokens)
+
+    pending = _inflight_chats.get(key)
+    if pending is not None:
+        logger.info("🔗 Joining identical in-flight chat request")
+        return await asyncio.shield(pending)
+
+    task = asyncio.ensure_future(
+        _chat_completion(messages, model, temperature, max_tokens)
+    )
+    _inflight_chats[key] = task
+    try:
+        return await asyncio.shield(task)
+    finally:
+        _inflight_chats.pop(key, None)
+
+
+async def _chat_completion(
+        messages: List[Dict],
+        model: str,
+        temperature: float,
+        max_tokens: int
+) -> str:
+    """Run a single chat completion call."""
     client = await _get_client()
 
     if not client:
         return "⚠️ AI service unavailable. Please try again later."
 
     try:
-        logger.info(f"🤖 Chat request: model={model}, messages={len(messages)}")
+        logger.info("🤖 Chat request: model=%s, messages=%d", model, len(messages))
+
+        estimated = _estimate_request_tokens(messages, max_tokens)
+        await _chat_limiter.acquire(estimated)
+
+        multimodal = any(isinstance(m.get("content"), list) for m in messages)
 
         response = await client.chat.completions.create(
             model=model,
             messages=messages,
             temperature=temperature,
             max_tokens=max_tokens,
+            timeout=VISION_TIMEOUT if multimodal else CHAT_TIMEOUT,
         )
 
+        if response.usage:
+            _chat_limiter.settle(estimated, response.usage.total_tokens)
+
         reply = (response.choices[0].message.content or "").strip()
-        logger.info(f"✅ Chat response received: {len(reply)} characters")
+        logger.info("✅ Chat response received: %d characters", len(reply))
 
         return reply
 
     except Exception as e:
-        logger.error(f"❌ Chat API error: {e}", exc_info=True)
+        logger.exception("❌ Chat API error: %s", e)
         return f"❌ AI error: {str(e)[:200]}"
 
 
@@ -103,6 +320,19 @@ async def chat_with_ai(
 # IMAGE GENERATION (DALL-E)
 # ============================================================================
 
+async def _generate_single(client, model: str, prompt: str, n: int, size: str, quality: str):
+    """Run one images.generate request through the image rate limiter."""
+    await _image_limiter.acquire()
+    return await client.images.generate(
+        model=model,
+        prompt=prompt,
+        n=n,
+        size=size,
+        quality=quality,
+        timeout=IMAGE_TIMEOUT
+    )
+
+
 async def generate_image(
         prompt: str,
         n: int = 1,
@@ -114,7 +344,7 @@ async def generate_image(
 
     Args:
         prompt: Text description of desired image
-        n: Number of images to generate (1-10 for DALL-E 2, 1 for DALL-E 3)
+        n: Number of images to generate (DALL-E 3 requests are sent in parallel)
         size: Image size (1024x1024, 1792x1024, or 1024x1792 for DALL-E 3)
         model: Model to use (dall-e-2 or dall-e-3)
 
@@ -128,25 +358,31 @@ async def generate_image(
         return []
 
     try:
-        logger.info(f"🎨 Generating image: '{prompt[:60]}...' using {model}")
+        logger.info("🎨 Generating image: '%.60s...' using %s", prompt, model)
 
-        # DALL-E 3 only supports n=1
-        if model == "dall-e-3" and n > 1:
-            n = 1
+        quality = "hd" if model == "dall-e-3" else "standard"
 
-        response = await client.images.generate(
-            model=model,
-            prompt=prompt,
-            n=n,
-            size=size,
-            quality="hd" if model == "dall-e-3" else "standard"
-        )
+        # DALL-E 3 only supports n=1 per request: fan out single-image calls
+        if model == "dall-e-3" and n > 1:
+            responses = await asyncio.gather(
+                *(_generate_single(client, model, prompt, 1, size, quality) for _ in range(n)),
+                return_exceptions=True
+            )
+            images = []
+            for resp in responses:
+                if isinstance(resp, BaseException):
+                    logger.warning("⚠️ One of %d image requests failed: %s", n, resp)
+                    continue
+                images.extend(resp.data)
+        else:
+            response = await _generate_single(client, model, prompt, n, size, quality)
+            images = response.data
 
         results = []
-        for img in response.data:
+        for img in images:
             if getattr(img, "url", None):
                 results.append(img.url)
-                logger.info(f"✅ Generated image URL: {img.url[:50]}...")
+                logger.info("✅ Generated image URL: %.50s...", img.url)
             elif getattr(img, "b64_json", None):
                 from base64 import b64decode
                 results.append(BytesIO(b64decode(img.b64_json)))
@@ -155,7 +391,7 @@ async def generate_image(
         return results
 
     except Exception as e:
-        logger.error(f"❌ Image generation error: {e}", exc_info=True)
+        logger.exception("❌ Image generation error: %s", e)
         return []
 
 
@@ -163,29 +399,71 @@ async def generate_image(
 # SMART IMAGE EDITING (Vision + Generation)
 # ============================================================================
 
-async def create_image_variation(
-        image_bytes: bytes,
-        prompt: str = "",
-        size: str = "1024x1024"
-) -> Optional[str]:
+# Vision analysis results keyed by (image sha256, edit prompt)
+VISION_CACHE_SIZE = 256
+_vision_prompt_cache: "OrderedDict[tuple[bytes, str], str]" = OrderedDict()
 
-    client = await _get_client()
 
-    if not client:
-        logger.error("❌ OpenAI client unavailable")
-        return None
+def _cached_vision_prompt(key: tuple[bytes, str]) -> Optional[str]:
+    """Return a cached DALL-E prompt and mark it recently used."""
+    enhanced_prompt = _vision_prompt_cache.get(key)
+    if enhanced_prompt is not None:
+        _vision_prompt_cache.move_to_end(key)
+    return enhanced_prompt
+
+
+def _remember_vision_prompt(key: tuple[bytes, str], enhanced_prompt: str) -> None:
+    """Cache a DALL-E prompt, evicting the least recently used entry."""
+    _vision_prompt_cache[key] = enhanced_prompt
+    _vision_prompt_cache.move_to_end(key)
+    if len(_vision_prompt_cache) > VISION_CACHE_SIZE:
+        _vision_prompt_cache.popitem(last=False)
+
+
+# Longest side sent to Vision; "high" detail never uses more than this
+VISION_MAX_SIDE = 2048
+
+
+def _prepare_vision_image(image_bytes: bytes, max_side: int = VISION_MAX_SIDE) -> bytes:
+    """
+    Downscale and re-encode a photo as JPEG for the Vision API.
+
+    Images already within max_side in JPEG format are returned unchanged,
+    as is anything Pillow cannot read.
+    """
+    if Image is None:
+        return image_bytes
 
     try:
-        logger.info(f"🛠 Smart image editing started")
-        logger.info(f"📝 Edit request: '{prompt[:100]}'")
+        img = Image.open(BytesIO(image_bytes))
+        if img.format == "JPEG" and max(img.size) <= max_side:
+            return image_bytes
 
-        # Step 1: Convert image to base64 for Vision API
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+        img.thumbnail((max_side, max_side))
+        if img.mode != "RGB":
+            img = img.convert("RGB")
 
-        # Step 2: Analyze image with GPT-4 Vision
-        analysis_prompt = f"""Analyze this photograph carefully and create a detailed DALL-E prompt.
+        out = BytesIO()
+        img.save(out, "JPEG", quality=85, optimize=True)
+        logger.info("📐 Vision image resized: %d -> %d bytes", len(image_bytes), out.tell())
+        return out.getvalue()
+
+    except Exception as e:
+        logger.warning("⚠️ Could not resize image for Vision: %s", e)
+        return image_bytes
+
+
+def _vision_data_url(image_bytes: bytes) -> str:
+    """Prepare a photo and encode it as a base64 data URL for Vision."""
+    image_bytes = _prepare_vision_image(image_bytes)
+    return (b"data:image/jpeg;base64," + base64.b64encode(image_bytes)).decode("ascii")
 
-USER'S EDIT REQUEST: "{prompt}"
+
+# Fixed Vision instructions, sent as the system message so OpenAI can
+# reuse the cached prefix across edit requests
+SYSTEM_ANALYSIS = """Analyze the user's photograph carefully and create a detailed DALL-E prompt.
+
+The user's message contains the photo and their USER EDIT REQUEST.
 
 YOUR TASK:
 1. Describe the main subject (person, object, scene) in detail:
@@ -210,66 +488,117 @@ YOUR TASK:
    ✅ Applies the user's edits seamlessly
    ✅ Uses photorealistic, detailed description
    ✅ Specifies "high quality photograph" style
-   
+
 CRITICAL: The generated image must look like the SAME photo with the requested changes applied, not a completely different image.
 
 Return ONLY the DALL-E prompt, nothing else."""
 
-        logger.info("🔍 Analyzing image with GPT-4 Vision...")
-
-        analysis_response = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}",
-                                "detail": "high"  # High detail for better analysis
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": analysis_prompt
+
+async def _analyze_for_edit(client, image_bytes: bytes, prompt: str) -> str:
+    """Describe the photo with GPT-4 Vision and fold in the requested edit."""
+    # Step 1: Shrink oversized uploads and build the base64 data URL.
+    # Resizing and encoding a multi-MB photo is CPU work, so keep it off
+    # the event loop
+    image_url = await asyncio.to_thread(_vision_data_url, image_bytes)
+
+    # Step 2: Analyze image with GPT-4 Vision; only the edit request
+    # changes between calls, the instructions stay a cacheable prefix
+    edit_request = f'USER EDIT REQUEST: "{prompt}"'
+
+    logger.info("🔍 Analyzing image with GPT-4 Vision...")
+
+    await _chat_limiter.acquire(
+        estimate_tokens(SYSTEM_ANALYSIS) + estimate_tokens(edit_request)
+        + IMAGE_INPUT_TOKENS + 500
+    )
+
+    analysis_response = await client.chat.completions.create(
+        model="gpt-4o",
+        messages=[
+            {
+                "role": "system",
+                "content": SYSTEM_ANALYSIS
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_url,
+                            "detail": "high"  # High detail for better analysis
                         }
-                    ]
-                }
-            ],
-            max_tokens=500,
-            temperature=0.3
-        )
+                    },
+                    {
+                        "type": "text",
+                        "text": edit_request
+                    }
+                ]
+            }
+        ],
+        max_tokens=500,
+        temperature=0.3,
+        timeout=VISION_TIMEOUT
+    )
+
+    enhanced_prompt = analysis_response.choices[0].message.content.strip()
+
+    if not enhanced_prompt or len(enhanced_prompt) < 50:
+        raise ValueError("Vision analysis produced insufficient prompt")
+
+    logger.info("✅ Vision analysis complete: %d chars", len(enhanced_prompt))
+    logger.info("📋 Enhanced prompt: %.150s...", enhanced_prompt)
+
+    return enhanced_prompt
 
-        enhanced_prompt = analysis_response.choices[0].message.content.strip()
 
-        if not enhanced_prompt or len(enhanced_prompt) < 50:
-            raise ValueError("Vision analysis produced insufficient prompt")
+async def create_image_variation(
+        image_bytes: bytes,
+        prompt: str = "",
+        size: str = "1024x1024"
+) -> Optional[str]:
 
-        logger.info(f"✅ Vision analysis complete: {len(enhanced_prompt)} chars")
-        logger.info(f"📋 Enhanced prompt: {enhanced_prompt[:150]}...")
+    client = await _get_client()
+
+    if not client:
+        logger.error("❌ OpenAI client unavailable")
+        return None
+
+    try:
+        logger.info("🛠 Smart image editing started")
+        logger.info("📝 Edit request: '%.100s'", prompt)
+
+        # Steps 1-2: Vision analysis, reused when the same image gets
+        # the same edit request again. Uploads are several MB, so hash
+        # them off the event loop
+        image_hash = await asyncio.to_thread(hashlib.sha256, image_bytes)
+        cache_key = (image_hash.digest(), prompt)
+        logger.info("🔑 Image hash: %.12s", cache_key[0].hex())
+
+        enhanced_prompt = _cached_vision_prompt(cache_key)
+        if enhanced_prompt:
+            logger.info("♻️ Reusing cached vision analysis")
+        else:
+            enhanced_prompt = await _analyze_for_edit(client, image_bytes, prompt)
+            _remember_vision_prompt(cache_key, enhanced_prompt)
 
         # Step 3: Generate edited image with DALL-E 3
         logger.info("🎨 Generating edited image with DALL-E 3...")
 
-        generation_response = await client.images.generate(
-            model="dall-e-3",
-            prompt=enhanced_prompt[:4000],
-            size=size,
-            quality="hd",
-            n=1
+        generation_response = await _generate_single(
+            client, "dall-e-3", enhanced_prompt[:4000], 1, size, "hd"
         )
 
         if not generation_response.data or len(generation_response.data) == 0:
             raise ValueError("DALL-E returned no images")
 
         edited_url = generation_response.data[0].url
-        logger.info(f"✅ Image edited successfully: {edited_url[:60]}...")
+        logger.info("✅ Image edited successfully: %.60s...", edited_url)
 
         return edited_url
 
     except Exception as e:
-        logger.error(f"❌ Smart image editing failed: {e}", exc_info=True)
+        logger.exception("❌ Smart image editing failed: %s", e)
 
         # Fallback: Try simple generation with user's prompt only
         try:
@@ -279,12 +608,8 @@ Return ONLY the DALL-E prompt, nothing else."""
 Professional photography, detailed, sharp focus, good lighting, 
 realistic colors, photorealistic style."""
 
-            fallback_response = await client.images.generate(
-                model="dall-e-3",
-                prompt=fallback_prompt,
-                size=size,
-                quality="standard",
-                n=1
+            fallback_response = await _generate_single(
+                client, "dall-e-3", fallback_prompt, 1, size, "standard"
             )
 
             if fallback_response.data and len(fallback_response.data) > 0:
@@ -292,11 +617,115 @@ realistic colors, photorealistic style."""
                 return fallback_response.data[0].url
 
         except Exception as fallback_error:
-            logger.error(f"❌ Fallback generation also failed: {fallback_error}")
+            logger.error("❌ Fallback generation also failed: %s", fallback_error)
 
         return None
 
 
+# ============================================================================
+# BATCH PROCESSING (non-interactive jobs)
+# ============================================================================
+
+BATCH_POLL_INTERVAL = 30.0
+
+
+async def submit_batch(
+        requests: List[Dict],
+        endpoint: str = "/v1/chat/completions"
+) -> Optional[str]:
+    """
+    Submit requests through the Batch API (half price, 24h completion window).
+
+    Use for background jobs only; interactive calls go through chat_with_ai.
+
+    Args:
+        requests: Request bodies, e.g. {"model": ..., "messages": [...]}
+        endpoint: API endpoint every request targets
+
+    Returns:
+        Batch ID or None on failure
+    """
+    client = await _get_client()
+
+    if not client or not requests:
+        return None
+
+    try:
+        lines = [
+            json.dumps({
+                "custom_id": f"req-{i}",
+                "method": "POST",
+                "url": endpoint,
+                "body": body,
+            })
+            for i, body in enumerate(requests)
+        ]
+        payload = ("\n".join(lines) + "\n").encode("utf-8")
+
+        batch_file = await client.files.create(
+            file=("batch.jsonl", payload),
+            purpose="batch"
+        )
+        batch = await client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=endpoint,
+            completion_window="24h"
+        )
+
+        logger.info("📦 Submitted batch %s: %d requests", batch.id, len(requests))
+        return batch.id
+
+    except Exception as e:
+        logger.exception("❌ Batch submit error: %s", e)
+        return None
+
+
+async def wait_for_batch(
+        batch_id: str,
+        poll_interval: float = BATCH_POLL_INTERVAL
+) -> Optional[List[Optional[Dict]]]:
+    """
+    Poll a batch until it finishes and download its results.
+
+    Returns:
+        Response bodies in submission order (None for failed requests),
+        or None if the batch did not complete
+    """
+    client = await _get_client()
+
+    if not client:
+        return None
+
+    try:
+        while True:
+            batch = await client.batches.retrieve(batch_id)
+            if batch.status == "completed":
+                break
+            if batch.status in ("failed", "expired", "cancelled"):
+                logger.error("❌ Batch %s ended with status %s", batch_id, batch.status)
+                return None
+            await asyncio.sleep(poll_interval)
+
+        results: List[Optional[Dict]] = [None] * batch.request_counts.total
+        if batch.output_file_id:
+            content = await client.files.content(batch.output_file_id)
+            for line in content.text.splitlines():
+                if not line:
+                    continue
+                item = json.loads(line)
+                index = int(item["custom_id"].split("-", 1)[1])
+                response = item.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[index] = response.get("body")
+
+        logger.info("✅ Batch %s completed: %d ok", batch_id, batch.request_counts.completed)
+        return results
+
+    except Exception as e:
+        logger.exception("❌ Batch wait error: %s", e)
+        return None
+
+
 # ============================================================================
 # LEGACY COMPATIBILITY
 # ============================================================================
@@ -318,9 +747,51 @@ async def edit_image_with_prompt(
 # UTILITY FUNCTIONS
 # ============================================================================
 
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """Load the GPT-4o BPE encoding once; None if tiktoken is unavailable."""
+    if tiktoken is None:
+        return None
+
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # tiktoken downloads encodings on first use
+        logger.warning("⚠️ tiktoken encoding unavailable, estimating tokens: %s", e)
+        return None
+
+
 def estimate_tokens(text: str) -> int:
+    """Count tokens with tiktoken when installed, else ~4 characters per token."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4
+
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+async def warm_token_encoding() -> None:
+    """Load the tiktoken encoding in a worker thread (first use downloads it)."""
+    await asyncio.to_thread(_get_encoding)
+
 
-    return len(text) // 4
+def _content_tokens(content: Union[str, List[Dict]], image_tokens: int = 0) -> int:
+    """
+    Count tokens of a message's content.
+
+    Multimodal content is counted by its text parts only; every other part
+    (image_url) costs image_tokens, so base64 payloads are never tokenized.
+    """
+    if not isinstance(content, list):
+        return estimate_tokens(str(content))
+
+    total = 0
+    for part in content:
+        if part.get("type") == "text":
+            total += estimate_tokens(part.get("text", ""))
+        else:
+            total += image_tokens
+    return total
 
 
 def truncate_messages(
@@ -345,36 +816,35 @@ def truncate_messages(
     if not messages:
         return []
 
-    # Separate system messages from conversation
-    system_msgs = [m for m in messages if m.get("role") == "system"]
-    other_msgs = [m for m in messages if m.get("role") != "system"]
+    # Partition and count every message in a single pass
+    system_msgs = []
+    other_msgs = []
+    other_tokens = []
+    current_tokens = 0
 
-    # Calculate current token usage
-    total_tokens = sum(
-        estimate_tokens(str(m.get("content", "")))
-        for m in messages
-    )
+    for m in messages:
+        msg_tokens = _content_tokens(m.get("content", ""))
+        if m.get("role") == "system":
+            system_msgs.append(m)
+            current_tokens += msg_tokens
+        else:
+            other_msgs.append(m)
+            other_tokens.append(msg_tokens)
 
     # If within limit, return as-is
-    if total_tokens <= max_tokens:
+    if current_tokens + sum(other_tokens) <= max_tokens:
         return messages
 
-    # Build result: keep system + most recent messages
-    result = system_msgs.copy()
-    current_tokens = sum(
-        estimate_tokens(str(m.get("content", "")))
-        for m in system_msgs
-    )
-
     # Add messages from newest to oldest until limit reached
-    for msg in reversed(other_msgs):
-        msg_tokens = estimate_tokens(str(msg.get("content", "")))
-
+    recent = []
+    for msg, msg_tokens in zip(reversed(other_msgs), reversed(other_tokens)):
         if current_tokens + msg_tokens <= max_tokens:
-            result.insert(len(system_msgs), msg)
+            recent.append(msg)
             current_tokens += msg_tokens
         else:
             break
 
-    logger.info(f"📊 Truncated messages: {len(messages)} → {len(result)}")
+    result = system_msgs + recent[::-1]
+
+    logger.info("📊 Truncated messages: %d → %d", len(messages), len(result))
     return result
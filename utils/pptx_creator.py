@@ -7,8 +7,12 @@ IMPROVED VERSION:
 - Enhanced text fitting
 """
 
+import asyncio
 import logging
 import re
+import uuid
+from functools import lru_cache
+from io import BytesIO
 from pathlib import Path
 from typing import List, Optional, Dict
 
@@ -19,6 +23,7 @@ try:
     from pptx.util import Inches, Pt
     from pptx.enum.text import PP_ALIGN, MSO_ANCHOR
     from pptx.dml.color import RGBColor
+    from pptx.shapes.shapetree import SlideShapes
 
     PPTX_AVAILABLE = True
 except ImportError:
@@ -65,13 +70,93 @@ THEMES = {
 # HELPER FUNCTIONS
 # ============================================================================
 
+_SPACE_RE = re.compile(r"\s+")
+_SAFE_RE = re.compile(r"[^\w\-_.]", flags=re.UNICODE)
+
+# Markdown emphasis and AI watermark phrases removed from slide text
+_MD_RE = re.compile(r"\*|__")
+_AI_TAG_RE = re.compile(r"AI Generated|Created by AI")
+
+
 def _slug(text: str) -> str:
     """Create filename-safe slug from text."""
-    text = re.sub(r"\s+", "_", text.strip())
-    text = re.sub(r"[^\w\-_.]", "", text, flags=re.UNICODE)
+    text = _SPACE_RE.sub("_", text.strip())
+    text = _SAFE_RE.sub("", text)
     return text[:50] or "presentation"
 
 
+def _clean(text: str) -> str:
+    """Strip markdown emphasis markers in a single pass."""
+    return _MD_RE.sub("", text).strip()
+
+
+def _clean_heading(text: str) -> str:
+    """Strip markdown and AI watermark phrases from title-slide text."""
+    return _AI_TAG_RE.sub("", _MD_RE.sub("", text)).strip()
+
+
+# ============================================================================
+# THEME TEMPLATES
+# ============================================================================
+
+# Layouts of the default template reused for our three slide kinds
+TITLE_LAYOUT = 0
+CONTENT_LAYOUT = 6
+CLOSING_LAYOUT = 2
+
+
+def _fill_background(part, color) -> None:
+    """Paint a solid background on a slide master or layout."""
+    fill = part.background.fill
+    fill.solid()
+    fill.fore_color.rgb = color
+
+
+def _add_layout_bar(layout, left, top, width, height, color) -> None:
+    """Add a borderless rectangle to a layout so every slide inherits it."""
+    bar = SlideShapes(layout.shapes._spTree, layout).add_shape(
+        1,  # Rectangle
+        left, top, width, height
+    )
+    bar.fill.solid()
+    bar.fill.fore_color.rgb = color
+    bar.line.fill.background()
+
+
+@lru_cache(maxsize=len(THEMES))
+def _theme_template(theme_name: str) -> bytes:
+    """
+    Build the themed template once and cache it serialized.
+
+    Backgrounds, the content header/footer bars and the title accent bar
+    live on the master and layouts, so slides only receive text boxes.
+    """
+    theme = THEMES[theme_name]
+    prs = Presentation()
+    prs.slide_width = Inches(10)
+    prs.slide_height = Inches(7.5)
+
+    _fill_background(prs.slide_master, theme["background"])
+
+    for idx in (TITLE_LAYOUT, CONTENT_LAYOUT, CLOSING_LAYOUT):
+        layout = prs.slide_layouts[idx]
+        for placeholder in list(layout.placeholders):
+            placeholder._element.getparent().remove(placeholder._element)
+
+    _add_layout_bar(prs.slide_layouts[TITLE_LAYOUT],
+                    Inches(0.5), Inches(6.5), Inches(9), Inches(0.15), theme["accent"])
+
+    content = prs.slide_layouts[CONTENT_LAYOUT]
+    _add_layout_bar(content, Inches(0), Inches(0), Inches(10), Inches(1.2), theme["primary"])
+    _add_layout_bar(content, Inches(0), Inches(7.3), Inches(10), Inches(0.2), theme["accent"])
+
+    _fill_background(prs.slide_layouts[CLOSING_LAYOUT], theme["primary"])
+
+    buffer = BytesIO()
+    prs.save(buffer)
+    return buffer.getvalue()
+
+
 # ============================================================================
 # SLIDE CREATORS
 # ============================================================================
@@ -81,18 +166,10 @@ def _create_title_slide(prs, title: str, subtitle: str, theme: Dict):
     if not PPTX_AVAILABLE:
         return None
 
-    slide = prs.slides.add_slide(prs.slide_layouts[6])
-
-    # Background
-    background = slide.background
-    fill = background.fill
-    fill.solid()
-    fill.fore_color.rgb = theme["background"]
+    slide = prs.slides.add_slide(prs.slide_layouts[TITLE_LAYOUT])
 
     # 🧹 CLEAN TITLE - Remove all markdown symbols
-    clean_title = title.replace("**", "").replace("*", "").replace("__", "")
-    clean_title = clean_title.replace("AI Generated", "").replace("Created by AI", "")
-    clean_title = clean_title.strip()
+    clean_title = _clean_heading(title)
 
     # Limit title length
     if len(clean_title) > 80:
@@ -126,9 +203,7 @@ def _create_title_slide(prs, title: str, subtitle: str, theme: Dict):
 
     # 🧹 CLEAN SUBTITLE
     if subtitle:
-        clean_subtitle = subtitle.replace("**", "").replace("*", "").replace("__", "")
-        clean_subtitle = clean_subtitle.replace("AI Generated", "").replace("Created by AI", "")
-        clean_subtitle = clean_subtitle.strip()
+        clean_subtitle = _clean_heading(subtitle)
 
         if not clean_subtitle or len(clean_subtitle) < 5:
             clean_subtitle = "Professional Presentation"
@@ -148,15 +223,6 @@ def _create_title_slide(prs, title: str, subtitle: str, theme: Dict):
         p.font.size = Pt(18)
         p.font.color.rgb = theme["secondary"]
 
-    # Decorative accent bar
-    accent_shape = slide.shapes.add_shape(
-        1,  # Rectangle
-        Inches(0.5), Inches(6.5), Inches(9), Inches(0.15)
-    )
-    accent_shape.fill.solid()
-    accent_shape.fill.fore_color.rgb = theme["accent"]
-    accent_shape.line.fill.background()
-
     return slide
 
 
@@ -171,32 +237,16 @@ def _create_content_slide(
     if not PPTX_AVAILABLE:
         return None
 
-    slide = prs.slides.add_slide(prs.slide_layouts[6])
-
-    # Background
-    background = slide.background
-    fill = background.fill
-    fill.solid()
-    fill.fore_color.rgb = theme["background"]
+    slide = prs.slides.add_slide(prs.slide_layouts[CONTENT_LAYOUT])
 
     # Clean title
-    clean_title = slide_title.replace("**", "").replace("*", "").replace("__", "")
-    clean_title = clean_title.strip()
+    clean_title = _clean(slide_title)
 
     # Limit title length
     if len(clean_title) > 70:
         clean_title = clean_title[:67] + "..."
 
-    # Header bar
-    header = slide.shapes.add_shape(
-        1,  # Rectangle
-        Inches(0), Inches(0), Inches(10), Inches(1.2)
-    )
-    header.fill.solid()
-    header.fill.fore_color.rgb = theme["primary"]
-    header.line.fill.background()
-
-    # Title in header - LARGER FONT
+    # Title in header (header bar comes from the layout) - LARGER FONT
     title_box = slide.shapes.add_textbox(
         Inches(0.5), Inches(0.25), Inches(8.5), Inches(0.9)
     )
@@ -246,8 +296,7 @@ def _create_content_slide(
     # Add bullets with LARGER FONT
     for i, bullet_text in enumerate(bullets):
         # Remove markdown
-        clean_bullet = bullet_text.replace("**", "").replace("*", "").replace("__", "")
-        clean_bullet = clean_bullet.strip()
+        clean_bullet = _clean(bullet_text)
 
         if not clean_bullet or len(clean_bullet) < 3:
             continue
@@ -271,15 +320,6 @@ def _create_content_slide(
 
         p.font.color.rgb = theme["text"]
 
-    # Accent footer
-    footer = slide.shapes.add_shape(
-        1,  # Rectangle
-        Inches(0), Inches(7.3), Inches(10), Inches(0.2)
-    )
-    footer.fill.solid()
-    footer.fill.fore_color.rgb = theme["accent"]
-    footer.line.fill.background()
-
     return slide
 
 
@@ -288,13 +328,7 @@ def _create_closing_slide(prs, theme: Dict, custom_message: str = None):
     if not PPTX_AVAILABLE:
         return None
 
-    slide = prs.slides.add_slide(prs.slide_layouts[6])
-
-    # Background
-    background = slide.background
-    fill = background.fill
-    fill.solid()
-    fill.fore_color.rgb = theme["primary"]
+    slide = prs.slides.add_slide(prs.slide_layouts[CLOSING_LAYOUT])
 
     # Thank you text
     left = Inches(1)
@@ -329,7 +363,7 @@ def _create_closing_slide(prs, theme: Dict, custom_message: str = None):
 # MAIN CREATION FUNCTION
 # ============================================================================
 
-def create_pptx(
+def _create_pptx_sync(
         title: str,
         slides: List[str],
         output_dir: str = "/tmp",
@@ -347,10 +381,10 @@ def create_pptx(
     try:
         logger.info(f"📊 Creating PPTX: theme={theme_name}, slides={len(slides)}")
 
-        theme = THEMES.get(theme_name, THEMES["professional"])
-        prs = Presentation()
-        prs.slide_width = Inches(10)
-        prs.slide_height = Inches(7.5)
+        if theme_name not in THEMES:
+            theme_name = "professional"
+        theme = THEMES[theme_name]
+        prs = Presentation(BytesIO(_theme_template(theme_name)))
 
         # Parse first slide
         if slides:
@@ -360,11 +394,11 @@ def create_pptx(
 
             # Clean title
             main_title = first_slide_lines[0] if first_slide_lines else title
-            main_title = main_title.replace("**", "").replace("*", "").replace("__", "").strip()
+            main_title = _clean(main_title)
 
             # Clean subtitle
             subtitle = first_slide_lines[1] if len(first_slide_lines) > 1 else "Professional Presentation"
-            subtitle = subtitle.replace("**", "").replace("*", "").replace("__", "").strip()
+            subtitle = _clean(subtitle)
         else:
             main_title = title
             subtitle = "Professional Presentation"
@@ -394,7 +428,8 @@ def create_pptx(
 
         # Save
         Path(output_dir).mkdir(parents=True, exist_ok=True)
-        fname = f"presentation_{_slug(main_title)}.pptx"
+        # Unique suffix: decks are built concurrently and titles repeat
+        fname = f"presentation_{_slug(main_title)}_{uuid.uuid4().hex[:12]}.pptx"
         path = str(Path(output_dir) / fname)
 
         prs.save(path)
@@ -405,3 +440,21 @@ def create_pptx(
     except Exception as e:
         logger.error(f"❌ PPTX error: {e}", exc_info=True)
         return None
+
+
+async def create_pptx(
+        title: str,
+        slides: List[str],
+        output_dir: str = "/tmp",
+        theme_name: str = "professional"
+) -> Optional[str]:
+    """
+    Create a PowerPoint file without blocking the event loop.
+
+    Building and zipping the XML takes seconds for larger decks, so the
+    work runs in a worker thread.
+
+    Returns:
+        Path to the saved .pptx file or None on failure
+    """
+    return await asyncio.to_thread(_create_pptx_sync, title, slides, output_dir, theme_name)
@@ -5,22 +5,131 @@ Handles daily quota tracking for free features and rolling trial
 system for premium features.
 """
 
+import asyncio
 import logging
+from collections import defaultdict
 from datetime import date, datetime, timedelta
 from typing import Optional
 
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
 from config import TRIAL_PERIOD_DAYS, TRIAL_USES_PER_PERIOD
-from models import QuotaUsage, User, TrialUsage
+from db import SessionLocal
+from models import QuotaUsage, User, TrialUsage, current_date
 
 logger = logging.getLogger(__name__)
 
+# Length of one rolling trial period
+_TRIAL_PERIOD = timedelta(days=TRIAL_PERIOD_DAYS)
+
 
 # ============================================================================
 # QUOTA MANAGEMENT (FREE FEATURES)
 # ============================================================================
 
+# Valid quota_type values (QuotaUsage counter columns)
+_QUOTA_COLS = QuotaUsage.COUNTER_FIELDS
+
+# Write-behind buffer for increments: (user_id, quota_type, usage_date) ->
+# amount. The date is taken when the increment happens, so late flushes
+# still land on the right day's row.
+# Bursts from one user collapse into a single upsert per flush. A batch
+# leaves the buffer when its write starts and is put back if the write
+# fails, so nothing is lost or counted twice. While a write is in flight
+# has_quota() may briefly undercount (fail open, like on DB errors).
+QUOTA_FLUSH_DELAY = 0.2        # seconds to wait before flushing
+QUOTA_FLUSH_RETRY_DELAY = 5.0  # seconds to wait after a failed flush
+QUOTA_FLUSH_MAX_PENDING = 100  # flush without delay after this many events
+_pending: "defaultdict[tuple[int, str, date], int]" = defaultdict(int)
+_pending_events: int = 0
+_flush_task: Optional[asyncio.Task] = None
+_flush_lock = asyncio.Lock()
+
+
+def _write_increments(batch: dict[tuple[int, str, date], int]) -> None:
+    """Apply a batch of increments in one transaction (runs in a worker thread)."""
+    db = SessionLocal()
+    try:
+        for (user_id, quota_type, usage_date), amount in batch.items():
+            QuotaUsage.increment(db, user_id, quota_type, amount, usage_date)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def _flush_pending() -> bool:
+    """
+    Write the buffered increments without blocking the event loop.
+
+    Returns:
+        True if the buffer was written (or empty), False on database errors
+    """
+    global _pending, _pending_events
+
+    # One flush at a time, so a batch is never written twice
+    async with _flush_lock:
+        if not _pending:
+            return True
+
+        batch, _pending = _pending, defaultdict(int)
+        _pending_events = 0
+
+        try:
+            await asyncio.to_thread(_write_increments, batch)
+        except SQLAlchemyError as e:
+            logger.error(f"❌ Error flushing {len(batch)} quota increments, will retry: {e}")
+            # Nothing was committed: merge the batch back for the retry
+            for key, amount in batch.items():
+                _pending[key] += amount
+            return False
+
+        logger.debug("📊 Flushed %s quota increments", len(batch))
+        return True
+
+
+async def _flush_after(delay: float) -> None:
+    """Flush once delay has passed and reschedule while anything is left."""
+    global _flush_task
+
+    await asyncio.sleep(delay)
+    # Shielded: cancelling this timer must not interrupt a write in progress
+    ok = await asyncio.shield(_flush_pending())
+
+    if _flush_task is asyncio.current_task():
+        _flush_task = None
+        if _pending:
+            _schedule_flush(QUOTA_FLUSH_DELAY if ok else QUOTA_FLUSH_RETRY_DELAY)
+
+
+def _schedule_flush(delay: float = QUOTA_FLUSH_DELAY) -> None:
+    """Start the flush timer unless one is already pending."""
+    global _flush_task
+
+    if _flush_task is None:
+        _flush_task = asyncio.get_running_loop().create_task(_flush_after(delay))
+
+
+async def flush_pending_quotas() -> None:
+    """Write all buffered quota increments now (call on shutdown)."""
+    global _flush_task
+
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
+
+    await _flush_pending()
+
+
+def _has_unlimited_access(user: User) -> bool:
+    """Admins and active premium users bypass quotas and trials (no DB access)."""
+    return user.is_admin or user.is_premium
+
+
 def has_quota(db: Session, user: User, quota_type: str) -> bool:
     """
     Check if user has remaining quota for a feature.
@@ -32,31 +141,72 @@ def has_quota(db: Session, user: User, quota_type: str) -> bool:
 
     Returns:
         True if user has quota remaining, False otherwise
+
+    Raises:
+        ValueError: If quota_type is not a quota counter
     """
+    if quota_type not in _QUOTA_COLS:
+        raise ValueError(f"Unknown quota type: {quota_type}")
+
     # Premium/admin users have unlimited quota
-    if user.is_premium or user.is_admin:
+    if _has_unlimited_access(user):
         return True
 
+    # Limit comes from the user/plan already in memory; with no allowance
+    # there is nothing to count, so skip the quota row lookup
+    limit = user.get_daily_limit(quota_type)
+    if limit <= 0:
+        logger.info("⚠️ User %s has no %s quota on this plan", user.tg_id, quota_type)
+        return False
+
     try:
-        quota = QuotaUsage.get_or_create(db, user.id, date.today())
-        used = getattr(quota, quota_type, 0)
-        limit = user.get_daily_limit(quota_type)
+        quota = QuotaUsage.get_or_create(db, user.id)
+        # Include increments not yet flushed to the database
+        used = getattr(quota, quota_type) + _pending.get(
+            (user.id, quota_type, quota.usage_date), 0
+        )
 
         has_remaining = used < limit
 
         if not has_remaining:
             logger.info(
-                f"⚠️ User {user.tg_id} exceeded {quota_type} quota: {used}/{limit}"
+                "⚠️ User %s exceeded %s quota: %s/%s", user.tg_id, quota_type, used, limit
             )
 
         return has_remaining
 
-    except Exception as e:
+    except SQLAlchemyError as e:
         logger.error(f"❌ Error checking quota for user {user.tg_id}: {e}")
-        # Fail open - allow usage on error
+        # Fail open - allow usage on database errors
         return True
 
 
+def increment_quota_atomic(
+        db: Session,
+        user_id: int,
+        quota_type: str,
+        amount: int = 1
+) -> int:
+    """
+    Add to today's counter in one INSERT ... ON CONFLICT DO UPDATE.
+
+    Needs only the user id, so callers don't have to load the User row.
+
+    Args:
+        db: Database session
+        user_id: Internal user id
+        quota_type: One of QuotaUsage.COUNTER_FIELDS
+        amount: Amount to increment by (default: 1)
+
+    Returns:
+        New counter value
+
+    Raises:
+        ValueError: If quota_type is not a quota counter
+    """
+    return QuotaUsage.increment(db, user_id, quota_type, amount)
+
+
 def increment_quota(
         db: Session,
         user: User,
@@ -66,24 +216,50 @@ def increment_quota(
     """
     Increment user's quota usage.
 
+    Inside the event loop the increment is buffered and written shortly
+    after in a worker thread; otherwise it is applied directly.
+
     Args:
-        db: Database session
+        db: Database session (used only outside the event loop)
         user: User instance
         quota_type: Type of quota to increment
         amount: Amount to increment by (default: 1)
+
+    Raises:
+        ValueError: If quota_type is not a quota counter
     """
-    try:
-        quota = QuotaUsage.get_or_create(db, user.id, date.today())
-        current = getattr(quota, quota_type, 0)
-        setattr(quota, quota_type, current + amount)
-        db.add(quota)
+    global _pending_events, _flush_task
 
-        logger.debug(
-            f"📊 Incremented {quota_type} for user {user.tg_id}: {current} -> {current + amount}"
-        )
+    if quota_type not in _QUOTA_COLS:
+        raise ValueError(f"Unknown quota type: {quota_type}")
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        # No event loop (scripts, admin tools) - write through
+        try:
+            current = increment_quota_atomic(db, user.id, quota_type, amount)
+            logger.debug(
+                "📊 Incremented %s for user %s: %s -> %s",
+                quota_type, user.tg_id, current - amount, current
+            )
+        except SQLAlchemyError as e:
+            logger.error(f"❌ Error incrementing quota for user {user.tg_id}: {e}")
+        return
+
+    _pending[(user.id, quota_type, current_date())] += amount
+    _pending_events += 1
+    logger.debug(
+        "📊 Queued %s +%s for user %s", quota_type, amount, user.tg_id
+    )
 
-    except Exception as e:
-        logger.error(f"❌ Error incrementing quota for user {user.tg_id}: {e}")
+    if _pending_events == QUOTA_FLUSH_MAX_PENDING and _flush_task is not None:
+        # Buffer is full: replace the waiting timer with an immediate flush
+        _flush_task.cancel()
+        _flush_task = None
+        _schedule_flush(0)
+    else:
+        _schedule_flush()
 
 
 def get_quota_status(db: Session, user: User) -> dict:
@@ -97,13 +273,28 @@ def get_quota_status(db: Session, user: User) -> dict:
     Returns:
         Dictionary with quota types as keys and (used, limit) tuples as values
     """
-    quota = QuotaUsage.get_or_create(db, user.id, date.today())
+    today = current_date()
+
+    # Read just the four counters; no row yet means nothing used today
+    row = db.execute(
+        select(
+            QuotaUsage.quick_chat,
+            QuotaUsage.code_chat,
+            QuotaUsage.convert,
+            QuotaUsage.pptx,
+        ).where(
+            QuotaUsage.user_id == user.id,
+            QuotaUsage.usage_date == today,
+        )
+    ).one_or_none() or (0, 0, 0, 0)
 
+    quota_types = ("quick_chat", "code_chat", "convert", "pptx")
     return {
-        "quick_chat": (quota.quick_chat, user.get_daily_limit("quick_chat")),
-        "code_chat": (quota.code_chat, user.get_daily_limit("code_chat")),
-        "convert": (quota.convert, user.get_daily_limit("convert")),
-        "pptx": (quota.pptx, user.get_daily_limit("pptx")),
+        quota_type: (
+            used + _pending.get((user.id, quota_type, today), 0),
+            user.get_daily_limit(quota_type),
+        )
+        for quota_type, used in zip(quota_types, row)
     }
 
 
@@ -128,29 +319,35 @@ def get_or_create_trial(db: Session, user: User) -> TrialUsage:
         trial = TrialUsage(user_id=user.id)
         db.add(trial)
         db.flush()
-        logger.info(f"✨ Created trial record for user {user.tg_id}")
+        logger.info("✨ Created trial record for user %s", user.tg_id)
 
     return trial
 
 
-def maybe_reset_trial(db: Session, user: User) -> bool:
+def maybe_reset_trial(db: Session, user: User, now: Optional[datetime] = None) -> bool:
     """
     Check if trial period has expired and reset if needed.
 
     Args:
         db: Database session
         user: User instance
+        now: Current UTC time, to share one timestamp across calls
 
     Returns:
         True if trial was reset, False otherwise
     """
+    # Trials don't apply to premium/admin users; skip the trial row lookup
+    if _has_unlimited_access(user):
+        return False
+
     trial = get_or_create_trial(db, user)
-    now = datetime.utcnow()
+    if now is None:
+        now = datetime.utcnow()
 
     # Check if enough time has passed since last reset
     time_since_reset = now - (trial.last_reset_at or now)
 
-    if time_since_reset >= timedelta(days=TRIAL_PERIOD_DAYS):
+    if time_since_reset >= _TRIAL_PERIOD:
         # Reset all counters
         trial.last_reset_at = now
         trial.image_gen_used = 0
@@ -159,8 +356,8 @@ def maybe_reset_trial(db: Session, user: User) -> bool:
         db.add(trial)
 
         logger.info(
-            f"🔄 Reset trial for user {user.tg_id} "
-            f"(last reset: {trial.last_reset_at})"
+            "🔄 Reset trial for user %s (last reset: %s)",
+            user.tg_id, trial.last_reset_at
         )
 
         return True
@@ -196,8 +393,8 @@ def consume_trial(db: Session, user: User, feature: str) -> bool:
 
     if used >= TRIAL_USES_PER_PERIOD:
         logger.warning(
-            f"⚠️ User {user.tg_id} has no remaining {feature} trials "
-            f"({used}/{TRIAL_USES_PER_PERIOD})"
+            "⚠️ User %s has no remaining %s trials (%s/%s)",
+            user.tg_id, feature, used, TRIAL_USES_PER_PERIOD
         )
         return False
 
@@ -205,49 +402,66 @@ def consume_trial(db: Session, user: User, feature: str) -> bool:
     db.add(trial)
 
     logger.info(
-        f"✅ Consumed {feature} trial for user {user.tg_id}: "
-        f"{used + 1}/{TRIAL_USES_PER_PERIOD}"
+        "✅ Consumed %s trial for user %s: %s/%s",
+        feature, user.tg_id, used + 1, TRIAL_USES_PER_PERIOD
     )
 
     return True
 
 
-def get_trial_status(db: Session, user: User) -> dict:
+def get_trial_status(db: Session, user: User, now: Optional[datetime] = None) -> dict:
     """
     Get current trial status for all features.
 
     Args:
         db: Database session
         user: User instance
+        now: Current UTC time, to share one timestamp across calls
 
     Returns:
         Dictionary with feature status information
     """
-    trial = get_or_create_trial(db, user)
-    now = datetime.utcnow()
+    # One single-row SELECT of the needed columns
+    row = db.execute(
+        select(
+            TrialUsage.image_gen_used,
+            TrialUsage.image_edit_used,
+            TrialUsage.pptx_used,
+            TrialUsage.last_reset_at,
+        ).where(TrialUsage.user_id == user.id)
+    ).one_or_none()
+
+    if row is None:
+        trial = get_or_create_trial(db, user)
+        row = (trial.image_gen_used, trial.image_edit_used,
+               trial.pptx_used, trial.last_reset_at)
+
+    image_gen_used, image_edit_used, pptx_used, last_reset_at = row
+    if now is None:
+        now = datetime.utcnow()
 
     # Calculate when trial will reset
-    time_since_reset = now - (trial.last_reset_at or now)
-    time_until_reset = timedelta(days=TRIAL_PERIOD_DAYS) - time_since_reset
+    time_since_reset = now - (last_reset_at or now)
+    time_until_reset = _TRIAL_PERIOD - time_since_reset
     days_until_reset = max(0, time_until_reset.days)
 
     return {
         "image_gen": {
-            "used": trial.image_gen_used,
-            "remaining": TRIAL_USES_PER_PERIOD - trial.image_gen_used,
+            "used": image_gen_used,
+            "remaining": TRIAL_USES_PER_PERIOD - image_gen_used,
             "total": TRIAL_USES_PER_PERIOD,
         },
         "image_edit": {
-            "used": trial.image_edit_used,
-            "remaining": TRIAL_USES_PER_PERIOD - trial.image_edit_used,
+            "used": image_edit_used,
+            "remaining": TRIAL_USES_PER_PERIOD - image_edit_used,
             "total": TRIAL_USES_PER_PERIOD,
         },
         "pptx": {
-            "used": trial.pptx_used,
-            "remaining": TRIAL_USES_PER_PERIOD - trial.pptx_used,
+            "used": pptx_used,
+            "remaining": TRIAL_USES_PER_PERIOD - pptx_used,
             "total": TRIAL_USES_PER_PERIOD,
         },
-        "last_reset": trial.last_reset_at,
+        "last_reset": last_reset_at,
         "days_until_reset": days_until_reset,
         "reset_period_days": TRIAL_PERIOD_DAYS,
     }
@@ -264,12 +478,8 @@ def can_use_feature(
         is_premium_feature: bool = False
 ) -> tuple[bool, str]:
 
-    # Admins can always use everything
-    if user.is_admin:
-        return True, ""
-
-    # Premium users can use everything
-    if user.is_premium:
+    # Admins and premium users can always use everything
+    if _has_unlimited_access(user):
         return True, ""
 
     # For premium features, check trial
@@ -4,13 +4,18 @@ Enhanced storage logger with comprehensive metadata tracking.
 Stores all files and images to Telegram channel with detailed information.
 """
 
+import asyncio
 import hashlib
 import logging
 import os
 import mimetypes
 from io import BytesIO
-from datetime import datetime
-from telegram import InputFile
+from datetime import datetime, timezone
+from typing import Optional
+
+import requests
+from sqlalchemy import insert
+from telegram import InputFile, InputMediaPhoto
 from models import StorageFile, ActionLog
 from models_enums import FileCategory, UserAction
 from config import STORAGE_CHANNEL_ID
@@ -23,9 +28,61 @@ logger = logging.getLogger(__name__)
 # ================================================================
 def _sha256_from_bytes(data: bytes) -> str:
     """Compute SHA-256 hash for content fingerprinting."""
-    h = hashlib.sha256()
-    h.update(data)
-    return h.hexdigest()
+    return hashlib.sha256(data).hexdigest()
+
+
+def _sha256_from_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """Compute SHA-256 of a file without loading it into memory."""
+    with open(path, "rb") as f:
+        # Python 3.11+: OpenSSL reads and hashes the file in one call
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "sha256").hexdigest()
+
+        h = hashlib.sha256()
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+        return h.hexdigest()
+
+
+class HashingBytesIO(BytesIO):
+    """
+    BytesIO that SHA-256 hashes data as it is written.
+
+    The digest matches the buffer contents as long as it is filled with
+    sequential writes (no seek/overwrite), so the bytes are read once.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._hash = hashlib.sha256()
+
+    def write(self, data) -> int:
+        self._hash.update(data)
+        return super().write(data)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+def _download_hashed(url: str, timeout: float) -> HashingBytesIO:
+    """Stream a URL into a HashingBytesIO."""
+    buffer = HashingBytesIO()
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            buffer.write(chunk)
+    return buffer
+
+
+async def download_image(url: str, timeout: float = 30) -> HashingBytesIO:
+    """
+    Download a generated image, hashing it while it streams in.
+
+    Runs in a worker thread so the blocking HTTP request does not stall
+    the event loop. Pass buffer.hexdigest() as sha256 to the save_*
+    functions to skip hashing the bytes again.
+    """
+    return await asyncio.to_thread(_download_hashed, url, timeout)
 
 
 def _guess_mime(filename: str) -> str:
@@ -34,6 +91,28 @@ def _guess_mime(filename: str) -> str:
     return mime or "application/octet-stream"
 
 
+_SEP = "=" * 40
+
+# Storage-channel caption; optional lines are filled in as whole blocks
+_CAPTION_TEMPLATE = (
+    "{sep}\n"
+    "📁 FILE STORAGE LOG\n"
+    "{sep}\n"
+    "\n"
+    "👤 User: {name}\n"
+    "🆔 Telegram ID: {tg_id}\n"
+    "🌐 Language: {lang}\n"
+    "\n"
+    "🎯 Action: {action}\n"
+    "{model_line}"
+    "{prompt_line}"
+    "{extras_block}"
+    "\n"
+    "⏰ Time: {ts} UTC\n"
+    "{sep}"
+)
+
+
 def _format_file_caption(user, category: FileCategory, prompt: str = "",
                          model: str = "", extra_info: dict = None) -> str:
     """
@@ -49,37 +128,54 @@ def _format_file_caption(user, category: FileCategory, prompt: str = "",
     Returns:
         Formatted caption string
     """
-    lines = [
-        "=" * 40,
-        f"📁 FILE STORAGE LOG",
-        "=" * 40,
-        "",
-        f"👤 User: {user.full_name}",
-        f"🆔 Telegram ID: {user.tg_id}",
-        f"🌐 Language: {user.lang.value if user.lang else 'N/A'}",
-        "",
-        f"🎯 Action: {category.value}",
-    ]
-
-    if model:
-        lines.append(f"🤖 Model: {model}")
-
     if prompt:
         # Limit prompt length for caption
         prompt_display = prompt[:200] + "..." if len(prompt) > 200 else prompt
-        lines.append(f"💬 Prompt: {prompt_display}")
+        prompt_line = f"💬 Prompt: {prompt_display}\n"
+    else:
+        prompt_line = ""
 
+    extras_block = ""
     if extra_info:
-        lines.append("")
-        lines.append("📊 Additional Info:")
-        for key, value in extra_info.items():
-            lines.append(f"  • {key}: {value}")
+        items = "\n".join(f"  • {key}: {value}" for key, value in extra_info.items())
+        extras_block = f"\n📊 Additional Info:\n{items}\n"
+
+    return _CAPTION_TEMPLATE.format(
+        sep=_SEP,
+        name=user.full_name,
+        tg_id=user.tg_id,
+        lang=user.lang.value if user.lang else 'N/A',
+        action=category.value,
+        model_line=f"🤖 Model: {model}\n" if model else "",
+        prompt_line=prompt_line,
+        extras_block=extras_block,
+        ts=datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+    )
+
+
+# Combined caption for the original/edited media group
+_MEDIA_GROUP_CAPTION = """🖼️ IMAGE EDITING LOG
+
+👤 User: {full_name}
+🆔 Telegram ID: {tg_id}
+🌐 Language: {lang}
 
-    lines.append("")
-    lines.append(f"⏰ Time: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
-    lines.append("=" * 40)
+━━━━━━━━━━━━━━━━━━━━━━━━━━
+📸 ORIGINAL (Left)
+📏 Size: {original_kb:.2f} KB
+🔑 Hash: {original_hash}...
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━
+🎨 EDITED (Right)
+📏 Size: {edited_kb:.2f} KB
+🔑 Hash: {edited_hash}...
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━
+🎯 Action: Image Edit
+🤖 Model: {model}
+💬 Prompt: {prompt}
 
-    return "\n".join(lines)
+⏰ {ts} UTC"""
 
 
 # ================================================================
@@ -121,10 +217,8 @@ async def save_and_log_file(
         mime = _guess_mime(file_name)
         size_bytes = os.path.getsize(file_path)
 
-        # Read and hash file
-        with open(file_path, "rb") as f:
-            file_bytes = f.read()
-        sha256 = _sha256_from_bytes(file_bytes)
+        # Hash file without holding it in memory
+        sha256 = _sha256_from_file(file_path)
 
         # Prepare detailed caption
         caption = _format_file_caption(
@@ -135,41 +229,43 @@ async def save_and_log_file(
             extra_info=extra or {}
         )
 
-        # Upload to Telegram storage channel
-        msg = await context.bot.send_document(
-            chat_id=STORAGE_CHANNEL_ID,
-            document=InputFile(BytesIO(file_bytes), filename=file_name),
-            caption=caption[:1024],  # Telegram caption limit
-        )
+        # Upload to Telegram storage channel straight from the file
+        with open(file_path, "rb") as f:
+            msg = await context.bot.send_document(
+                chat_id=STORAGE_CHANNEL_ID,
+                document=InputFile(f, filename=file_name),
+                caption=caption[:1024],  # Telegram caption limit
+            )
 
         tg_file_id = msg.document.file_id if msg.document else None
         if not tg_file_id:
             logger.warning("⚠️ Telegram returned no file_id")
             return None
 
-        # Create database record
-        storage_entry = StorageFile(
-            owner_id=user.id,
-            telegram_file_id=tg_file_id,
-            storage_channel_id=STORAGE_CHANNEL_ID,
-            storage_message_id=msg.message_id,
-            category=category,
-            mime=mime,
-            original_name=file_name,
-            size_bytes=size_bytes,
-            sha256=sha256,
-            extra={
-                "prompt": prompt,
-                "model": model,
-                "user_lang": user.lang.value if user.lang else None,
-                **(extra or {})
-            },
-        )
-        db.add(storage_entry)
-        db.flush()
+        # Create database record; RETURNING gives the id without a flush
+        storage_entry = db.scalars(
+            insert(StorageFile).returning(StorageFile),
+            [dict(
+                owner_id=user.id,
+                telegram_file_id=tg_file_id,
+                storage_channel_id=STORAGE_CHANNEL_ID,
+                storage_message_id=msg.message_id,
+                category=category,
+                mime=mime,
+                original_name=file_name,
+                size_bytes=size_bytes,
+                sha256=sha256,
+                extra={
+                    "prompt": prompt,
+                    "model": model,
+                    "user_lang": user.lang.value if user.lang else None,
+                    **(extra or {})
+                },
+            )],
+        ).one()
 
         # Log action
-        db.add(ActionLog(
+        db.execute(insert(ActionLog).values(
             user_id=user.id,
             action=UserAction.file_upload,
             ref_id=storage_entry.id,
@@ -181,7 +277,7 @@ async def save_and_log_file(
         ))
         db.commit()
 
-        logger.info(f"✅ Stored file: {file_name} ({category.value})")
+        logger.info("✅ Stored file: %s (%s)", file_name, category.value)
         return storage_entry
 
     except Exception as e:
@@ -198,7 +294,8 @@ async def save_and_log_image(
         prompt: str,
         category: FileCategory,
         model: str = "",
-        extra: dict = None
+        extra: dict = None,
+        sha256: Optional[str] = None
 ):
     """
     Upload generated/edited image to storage channel with metadata.
@@ -212,12 +309,18 @@ async def save_and_log_image(
         category: File category (image_gen, image_edit)
         model: AI model used
         extra: Additional metadata
+        sha256: Precomputed hash (e.g. from download_image), if known
 
     Returns:
         StorageFile object or None
     """
     try:
-        sha256 = _sha256_from_bytes(image_data)
+        # Hash in a worker thread while the upload runs
+        sha256_task = None
+        if sha256 is None:
+            sha256_task = asyncio.create_task(
+                asyncio.to_thread(_sha256_from_bytes, image_data)
+            )
 
         # Format caption
         caption = _format_file_caption(
@@ -235,30 +338,34 @@ async def save_and_log_image(
             caption=caption[:1024]  # Telegram limit
         )
 
+        if sha256_task is not None:
+            sha256 = await sha256_task
+
         tg_file_id = msg.photo[-1].file_id if msg.photo else None
         if not tg_file_id:
             logger.warning("⚠️ No file_id returned for image")
             return None
 
-        # Create database record
-        storage_entry = StorageFile(
-            owner_id=user.id,
-            telegram_file_id=tg_file_id,
-            storage_channel_id=STORAGE_CHANNEL_ID,
-            storage_message_id=msg.message_id,
-            category=category,
-            mime="image/png",
-            size_bytes=len(image_data),
-            sha256=sha256,
-            extra={
-                "prompt": prompt,
-                "model": model,
-                "user_lang": user.lang.value if user.lang else None,
-                **(extra or {})
-            },
-        )
-        db.add(storage_entry)
-        db.flush()
+        # Create database record; RETURNING gives the id without a flush
+        storage_entry = db.scalars(
+            insert(StorageFile).returning(StorageFile),
+            [dict(
+                owner_id=user.id,
+                telegram_file_id=tg_file_id,
+                storage_channel_id=STORAGE_CHANNEL_ID,
+                storage_message_id=msg.message_id,
+                category=category,
+                mime="image/png",
+                size_bytes=len(image_data),
+                sha256=sha256,
+                extra={
+                    "prompt": prompt,
+                    "model": model,
+                    "user_lang": user.lang.value if user.lang else None,
+                    **(extra or {})
+                },
+            )],
+        ).one()
 
         # Log action
         action_type = (
@@ -266,7 +373,7 @@ async def save_and_log_image(
             else UserAction.image_edit
         )
 
-        db.add(ActionLog(
+        db.execute(insert(ActionLog).values(
             user_id=user.id,
             action=action_type,
             ref_id=storage_entry.id,
@@ -278,7 +385,7 @@ async def save_and_log_image(
         ))
         db.commit()
 
-        logger.info(f"✅ Stored image ({category.value})")
+        logger.info("✅ Stored image (%s)", category.value)
         return storage_entry
 
     except Exception as e:
@@ -294,45 +401,39 @@ async def save_both_images(
         original_bytes: bytes,
         edited_bytes: bytes,
         prompt: str,
-        model: str = "dall-e-3"
+        model: str = "dall-e-3",
+        edited_sha256: Optional[str] = None
 ):
     """
     Save both images to storage channel as media group with combined caption.
 
+    edited_sha256 may carry the hash from download_image to skip rehashing.
+
     🔧 FIXED: Media group with ONE caption showing info for BOTH images
     """
     try:
-        from telegram import InputMediaPhoto
-        from io import BytesIO
-        from datetime import datetime
-
-        # Calculate hashes
-        original_sha256 = _sha256_from_bytes(original_bytes)
-        edited_sha256 = _sha256_from_bytes(edited_bytes)
+        # Calculate hashes off the event loop, in parallel when both needed
+        if edited_sha256 is None:
+            original_sha256, edited_sha256 = await asyncio.gather(
+                asyncio.to_thread(_sha256_from_bytes, original_bytes),
+                asyncio.to_thread(_sha256_from_bytes, edited_bytes),
+            )
+        else:
+            original_sha256 = await asyncio.to_thread(_sha256_from_bytes, original_bytes)
 
         # 🔧 FIXED: ONE combined caption with info for BOTH images
-        combined_caption = f"""🖼️ IMAGE EDITING LOG
-
-👤 User: {user.full_name}
-🆔 Telegram ID: {user.tg_id}
-🌐 Language: {user.lang.value if user.lang else 'N/A'}
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━
-📸 ORIGINAL (Left)
-📏 Size: {round(len(original_bytes) / 1024, 2)} KB
-🔑 Hash: {original_sha256[:12]}...
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━
-🎨 EDITED (Right)
-📏 Size: {round(len(edited_bytes) / 1024, 2)} KB
-🔑 Hash: {edited_sha256[:12]}...
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━
-🎯 Action: Image Edit
-🤖 Model: {model}
-💬 Prompt: {prompt[:120]}{'...' if len(prompt) > 120 else ''}
-
-⏰ {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC"""
+        combined_caption = _MEDIA_GROUP_CAPTION.format_map({
+            "full_name": user.full_name,
+            "tg_id": user.tg_id,
+            "lang": user.lang.value if user.lang else 'N/A',
+            "original_kb": len(original_bytes) / 1024,
+            "original_hash": original_sha256[:12],
+            "edited_kb": len(edited_bytes) / 1024,
+            "edited_hash": edited_sha256[:12],
+            "model": model,
+            "prompt": prompt[:120] + "..." if len(prompt) > 120 else prompt,
+            "ts": datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        })
 
         # 🔧 Send as media group with ONE combined caption
         media_group = [
@@ -366,53 +467,52 @@ async def save_both_images(
             logger.warning("⚠️ Missing file IDs from media group")
             return None, None
 
-        # Create database record for ORIGINAL image
-        original_storage = StorageFile(
-            owner_id=user.id,
-            telegram_file_id=original_file_id,
-            storage_channel_id=STORAGE_CHANNEL_ID,
-            storage_message_id=original_msg.message_id,
-            category=FileCategory.image_edit,
-            mime="image/png",
-            size_bytes=len(original_bytes),
-            sha256=original_sha256,
-            extra={
-                "type": "original",
-                "edit_prompt": prompt,
-                "model": model,
-                "user_lang": user.lang.value if user.lang else None,
-                "paired_with": "edited_image",
-                "media_group_id": edited_msg.message_id
-            },
-        )
-        db.add(original_storage)
-        db.flush()
-
-        # Create database record for EDITED image
-        edited_storage = StorageFile(
-            owner_id=user.id,
-            telegram_file_id=edited_file_id,
-            storage_channel_id=STORAGE_CHANNEL_ID,
-            storage_message_id=edited_msg.message_id,
-            category=FileCategory.image_edit,
-            mime="image/png",
-            size_bytes=len(edited_bytes),
-            sha256=edited_sha256,
-            extra={
-                "type": "edited",
-                "prompt": prompt,
-                "model": model,
-                "user_lang": user.lang.value if user.lang else None,
-                "paired_with": "original_image",
-                "original_file_id": original_file_id,
-                "media_group_id": original_msg.message_id
-            },
-        )
-        db.add(edited_storage)
-        db.flush()
+        # Create both database records in one INSERT ... RETURNING
+        original_storage, edited_storage = db.scalars(
+            insert(StorageFile).returning(StorageFile, sort_by_parameter_order=True),
+            [
+                dict(
+                    owner_id=user.id,
+                    telegram_file_id=original_file_id,
+                    storage_channel_id=STORAGE_CHANNEL_ID,
+                    storage_message_id=original_msg.message_id,
+                    category=FileCategory.image_edit,
+                    mime="image/png",
+                    size_bytes=len(original_bytes),
+                    sha256=original_sha256,
+                    extra={
+                        "type": "original",
+                        "edit_prompt": prompt,
+                        "model": model,
+                        "user_lang": user.lang.value if user.lang else None,
+                        "paired_with": "edited_image",
+                        "media_group_id": edited_msg.message_id
+                    },
+                ),
+                dict(
+                    owner_id=user.id,
+                    telegram_file_id=edited_file_id,
+                    storage_channel_id=STORAGE_CHANNEL_ID,
+                    storage_message_id=edited_msg.message_id,
+                    category=FileCategory.image_edit,
+                    mime="image/png",
+                    size_bytes=len(edited_bytes),
+                    sha256=edited_sha256,
+                    extra={
+                        "type": "edited",
+                        "prompt": prompt,
+                        "model": model,
+                        "user_lang": user.lang.value if user.lang else None,
+                        "paired_with": "original_image",
+                        "original_file_id": original_file_id,
+                        "media_group_id": original_msg.message_id
+                    },
+                ),
+            ],
+        ).all()
 
         # Log action
-        db.add(ActionLog(
+        db.execute(insert(ActionLog).values(
             user_id=user.id,
             action=UserAction.image_edit,
             ref_id=edited_storage.id,